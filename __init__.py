@@ -49,7 +49,12 @@ else:
         setLogOperator
     )
     from .io_import_z64 import (
-        F3DZEX
+        F3DZEX,
+        SegmentPool,
+        buildAnimationAction
+    )
+    from .segment_files import (
+        SegmentFileFinder
     )
 
 import os
@@ -99,6 +104,16 @@ class ImportZ64(bpy.types.Operator, ImportHelper):
     enable_matrices: BoolProperty(name="Matrices",
                                  description="Use 0xDA G_MTX and 0xD8 G_POPMTX commands",
                                  default=True,)
+    bulk_mesh_creation: BoolProperty(name="Bulk Mesh Creation",
+                                 description="Create meshes by setting all vertices, faces, UVs and colors at once.\n"
+                                             "When off, meshes are built one element at a time with bmesh (slower, kept for comparison)",
+                                 default=True,)
+    link_duplicate_meshes: BoolProperty(name="Link Duplicate Meshes",
+                                 description="Objects made from identical geometry (same display list read with the same state) share their mesh data, instead of each having a copy",
+                                 default=True,)
+    cache_scan_results: BoolProperty(name="Cache Scan Results",
+                                 description="Save what was found when scanning the imported file (hierarchies, animations, display lists, map headers) in a cache in the Blender user data directory, so importing the same file again skips scanning",
+                                 default=True,)
     detected_display_lists_use_transparency: BoolProperty(name="Default to transparency",
                                                          description="Set material to use transparency or not for display lists that were detected",
                                                          default=False,)
@@ -131,6 +146,16 @@ class ImportZ64(bpy.types.Operator, ImportHelper):
     enable_tex_mirror_sharp_ocarina_tags: BoolProperty(name="Texture Mirror SO Tags",
                                   description="Add #MirrorX and #MirrorY tags where necessary in the texture filename, used by SharpOcarina",
                                   default=False,)
+    write_texture_files: BoolProperty(name="Write Texture Files",
+                                  description="Write textures as .tga files in a textures folder next to the imported file and use those files, needed for SharpOcarina.\n"
+                                              "Otherwise images are created directly in Blender (and packed in the .blend file), which is faster",
+                                  default=True,)
+    enable_texture_cache: BoolProperty(name="Texture Cache",
+                                  description="Keep decoded textures in a cache shared by all imports, to not decode the same texture data again",
+                                  default=True,)
+    texture_cache_size: IntProperty(name="Cache Size (MiB)",
+                                  description="Maximum disk space used by the texture cache, least recently used textures are removed past it",
+                                  default=256, min=1, soft_max=4096)
     # Shadeless materials no longer exist in 2.80. Only Eevee Renderer has an alternative.
     # enable_shadeless_materials: BoolProperty(name="Shadeless Materials",
     #                               description="Set materials to be shadeless, prevents using environment colors in-game",
@@ -141,6 +166,12 @@ class ImportZ64(bpy.types.Operator, ImportHelper):
     load_animations: BoolProperty(name="Load animations",
                              description="For animated actors, load all animations or none",
                              default=True,)
+    lazy_animations: BoolProperty(name="Build On Demand",
+                             description="Only list the animations found on the armature, build the actions of the animations picked from the Zelda64 Animations panel in the armature's object properties",
+                             default=False,)
+    parallel_animations: BoolProperty(name="Decode In Parallel",
+                             description="Decode all animations at once in worker processes (one per core) before building them, faster for actors with many animations",
+                             default=False,)
     majora_anims: BoolProperty(name="MajorasAnims",
                              description="Majora's Mask Link's Anims.",
                              default=False,)
@@ -180,21 +211,26 @@ class ImportZ64(bpy.types.Operator, ImportHelper):
             setLogFile(logfile_path)
         setLogOperator(self, self.report_logging_level)
 
+        # segment files used by several imported files are loaded once
+        segmentPool = SegmentPool()
         try:
+            # lists each directory once for all files
+            finder = SegmentFileFinder()
             for file in self.files:
                 filepath = os.path.join(self.directory, file.name)
                 if len(self.files) == 1 or not self.prefix_multi_import:
                     prefix = ""
                 else:
                     prefix = file.name + "_"
-                self.executeSingle(filepath, keywords, prefix=prefix)
+                self.executeSingle(filepath, keywords, prefix=prefix, finder=finder, segmentPool=segmentPool)
             bpy.context.view_layer.update()
         finally:
+            segmentPool.close()
             setLogFile(None)
             setLogOperator(None)
         return {"FINISHED"}
 
-    def executeSingle(self, filepath, keywords, prefix=""):
+    def executeSingle(self, filepath, keywords, prefix="", finder=None, segmentPool=None):
         keywords["fpath"], fext = os.path.splitext(filepath)
         keywords["fpath"], fname = os.path.split(keywords["fpath"])
 
@@ -218,35 +254,22 @@ class ImportZ64(bpy.types.Operator, ImportHelper):
 
         log.info(f"Importing '{fname}'...")
         time_start = time.time()
-        self.run_import(filepath, importType, keywords, prefix=prefix)
+        self.run_import(filepath, importType, keywords, prefix=prefix, finder=finder, segmentPool=segmentPool)
         log.info(f"SUCCESS:  Elapsed time {time.time() - time_start:.4f} sec")
 
-    def run_import(self, filepath, importType, keywords, prefix=""):
+    def run_import(self, filepath, importType, keywords, prefix="", finder=None, segmentPool=None):
         fpath, fext = os.path.splitext(filepath)
         fpath, fname = os.path.split(fpath)
 
         log = getLogger("ImportZ64.run_import")
-        f3dzex = F3DZEX(self.detected_display_lists_use_transparency, keywords, prefix=prefix)
+        f3dzex = F3DZEX(self.detected_display_lists_use_transparency, keywords, prefix=prefix, segmentPool=segmentPool)
         f3dzex.loaddisplaylists(os.path.join(fpath, "displaylists.txt"))
         if self.load_other_segments:
             log.debug("Loading other segments")
-            # for segment 2, use [room file prefix]_scene then [same].zscene then segment_02.zdata then fallback to any .zscene
-            scene_file = None
-            if "_room" in fname:
-                scene_file = os.path.join(fpath, f"{fname[:fname.index('_room')]}_scene")
-                if not os.path.isfile(scene_file):
-                    scene_file += ".zscene"
-            if not scene_file or not os.path.isfile(scene_file):
-                scene_file = os.path.join(fpath, "segment_02.zdata")
-            if not scene_file or not os.path.isfile(scene_file):
-                scene_file = None
-                for f in os.listdir(fpath):
-                    if f.endswith(".zscene"):
-                        if scene_file:
-                            log.warning(f"Found another .zscene file {f}, keeping {scene_file}")
-                        else:
-                            scene_file = os.path.join(fpath, f)
-            if scene_file and os.path.isfile(scene_file):
+            if finder is None:
+                finder = SegmentFileFinder()
+            scene_file = finder.findSceneFile(fpath, fname)
+            if scene_file:
                 log.info(f"Loading scene segment 0x02 from {scene_file}")
                 f3dzex.loadSegment(2, scene_file)
             else:
@@ -254,22 +277,26 @@ class ImportZ64(bpy.types.Operator, ImportHelper):
             for i in range(16):
                 if i == 2:
                     continue
-                # I was told this is "ZRE" naming?
-                segment_data_file = os.path.join(fpath, f"segment_{i:02X}.zdata")
-                if os.path.isfile(segment_data_file):
+                segment_data_file = finder.findSegmentFile(fpath, i)
+                if segment_data_file:
                     log.info(f"Loading segment 0x{i:02X} from {segment_data_file}")
                     f3dzex.loadSegment(i, segment_data_file)
                 else:
                     log.debug(f"No file found to load segment 0x{i:02X} from")
 
-        if importType == "ROOM":
-            log.debug("Importing room")
-            f3dzex.loadSegment(0x03, filepath)
-            f3dzex.importMap()
-        else:
-            log.debug("Importing object")
-            f3dzex.loadSegment(0x06, filepath)
-            f3dzex.importObj()
+        try:
+            if importType == "ROOM":
+                log.debug("Importing room")
+                f3dzex.loadSegment(0x03, filepath)
+                f3dzex.importMap()
+            else:
+                log.debug("Importing object")
+                f3dzex.loadSegment(0x06, filepath)
+                f3dzex.importObj()
+        finally:
+            f3dzex.releaseSegments()
+        log.info(f"Materials: {f3dzex.materialMisses} created, {f3dzex.materialHits} reused")
+        log.info(f"Shared display lists: {f3dzex.displayListMemoMisses} read, {f3dzex.displayListMemoHits} replayed")
 
         if self.set_view_3d_parameters:
             for screen in bpy.data.screens:
@@ -312,6 +339,9 @@ class ZOBJ_PT_import_config(bpy.types.Panel):
         layout.prop(operator, "load_other_segments")
         layout.prop(operator, "original_object_scale")
         layout.prop(operator, "enable_matrices")
+        layout.prop(operator, "bulk_mesh_creation")
+        layout.prop(operator, "link_duplicate_meshes")
+        layout.prop(operator, "cache_scan_results")
         layout.prop(operator, "prefix_multi_import")
         layout.prop(operator, "set_view_3d_parameters")
 
@@ -336,6 +366,7 @@ class ZOBJ_PT_import_texture(bpy.types.Panel):
         sfile = context.space_data
         operator = sfile.active_operator
 
+        layout.prop(operator, "write_texture_files")
         layout.prop(operator, "enable_tex_clamp_blender")
         if operator.enable_tex_clamp_blender:
             wBox = layout.box()
@@ -357,6 +388,9 @@ class ZOBJ_PT_import_texture(bpy.types.Panel):
         layout.prop(operator, "enable_env_color")
         layout.prop(operator, "invert_env_color")
         layout.prop(operator, "import_textures")
+        layout.prop(operator, "enable_texture_cache")
+        if operator.enable_texture_cache:
+            layout.prop(operator, "texture_cache_size")
 
 class ZOBJ_PT_import_animation(bpy.types.Panel):
     bl_space_type = "FILE_BROWSER"
@@ -380,6 +414,10 @@ class ZOBJ_PT_import_animation(bpy.types.Panel):
         operator = sfile.active_operator
 
         layout.prop(operator, "load_animations")
+        if operator.load_animations:
+            layout.prop(operator, "lazy_animations")
+            if not operator.lazy_animations:
+                layout.prop(operator, "parallel_animations")
         layout.prop(operator, "majora_anims")
         layout.prop(operator, "external_animes") 
 
@@ -409,10 +447,89 @@ class ZOBJ_PT_import_logging(bpy.types.Panel):
         if operator.logging_logfile_enable:
             layout.prop(operator, "logging_logfile_path")
 
+class Z64AnimationEntry(bpy.types.PropertyGroup):
+    """An animation found when importing with Build On Demand, see F3DZEX.recordAnimations"""
+    # name (from PropertyGroup) is the name of the action
+    filepath: StringProperty(subtype="FILE_PATH")
+    offset: IntProperty()
+    frame_count: IntProperty()
+    bone_count: IntProperty()
+    scale_factor: FloatProperty()
+    select: BoolProperty(name="Select", description="Build this animation")
+    action: PointerProperty(type=bpy.types.Action)
+
+class Z64_UL_animations(bpy.types.UIList):
+    def draw_item(self, context, layout, data, item, icon, active_data, active_propname):
+        row = layout.row(align=True)
+        row.prop(item, "select", text="")
+        row.label(text=item.name, icon="ACTION" if item.action else "BLANK1")
+        row.label(text=f"{item.frame_count} frames")
+
+class Z64_OT_build_animations(bpy.types.Operator):
+    """Build the actions of the selected animations (or of the active one if none is selected) and play the active one"""
+    bl_idname = "object.z64_build_animations"
+    bl_label = "Build Animations"
+    bl_options = {"REGISTER", "UNDO"}
+
+    @classmethod
+    def poll(cls, context):
+        ob = context.object
+        return ob is not None and ob.type == "ARMATURE" and len(ob.z64_animations) > 0
+
+    def execute(self, context):
+        log = getLogger("Z64_OT_build_animations.execute")
+        setLogOperator(self)
+        try:
+            ob = context.object
+            animations = ob.z64_animations
+            active = animations[ob.z64_animations_index] if 0 <= ob.z64_animations_index < len(animations) else None
+            entries = [entry for entry in animations if entry.select] or ([active] if active else [])
+            built = 0
+            for entry in entries:
+                # built actions are kept and reused, unless they were deleted
+                if entry.action:
+                    continue
+                try:
+                    entry.action, frameCount = buildAnimationAction(entry.name, entry.filepath, entry.offset, entry.bone_count, entry.scale_factor)
+                except Exception:
+                    log.exception(f"Could not build animation {entry.name} from {entry.filepath}")
+                    continue
+                context.scene.frame_end = max(frameCount, context.scene.frame_end)
+                built += 1
+            log.info(f"Built {built} animations, {len(entries) - built} already built or failed")
+            if active and active.action:
+                if ob.animation_data is None:
+                    ob.animation_data_create()
+                ob.animation_data.action = active.action
+        finally:
+            setLogOperator(None)
+        return {"FINISHED"}
+
+class Z64_PT_animations(bpy.types.Panel):
+    bl_space_type = "PROPERTIES"
+    bl_region_type = "WINDOW"
+    bl_context = "object"
+    bl_label = "Zelda64 Animations"
+
+    @classmethod
+    def poll(cls, context):
+        ob = context.object
+        return ob is not None and ob.type == "ARMATURE" and len(ob.z64_animations) > 0
+
+    def draw(self, context):
+        layout = self.layout
+        ob = context.object
+        layout.template_list("Z64_UL_animations", "", ob, "z64_animations", ob, "z64_animations_index")
+        layout.operator(Z64_OT_build_animations.bl_idname)
+
 def menu_func_import(self, context):
     self.layout.operator(ImportZ64.bl_idname, text="Zelda64 (.zobj;.zroom;.zmap)")
 
 classes = (
+    Z64AnimationEntry,
+    Z64_UL_animations,
+    Z64_OT_build_animations,
+    Z64_PT_animations,
     ImportZ64,
     ZOBJ_PT_import_config,
     ZOBJ_PT_import_texture,
@@ -424,12 +541,16 @@ def register():
     registerLogging()
     for cls in classes:
         bpy.utils.register_class(cls)
+    bpy.types.Object.z64_animations = CollectionProperty(type=Z64AnimationEntry)
+    bpy.types.Object.z64_animations_index = IntProperty()
 
     bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
 
 def unregister():
     bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
 
+    del bpy.types.Object.z64_animations
+    del bpy.types.Object.z64_animations_index
     for cls in classes:
         bpy.utils.unregister_class(cls)
     unregisterLogging()
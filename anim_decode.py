@@ -0,0 +1,171 @@
+# Animation decoding, all frames at once with numpy
+# Does not depend on bpy, nor on other modules of the addon, so it can be used from anywhere,
+# including worker processes running this file as a script (see decodeAnimationsInWorkers)
+
+import mmap
+import os
+import pickle
+import struct
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+def readAnimationHeader(data, offset):
+    """
+    Read the animation header at offset in data (bytes-like):
+    ffff0000 rrrrrrrr iiiiiiii llll0000 (frame count, rotation values, rotation indices, limit)
+    Returns (frame count, rotation values offset, rotation indices offset, limit), offsets are within data
+    """
+    frameCount = struct.unpack_from(">h", data, offset)[0]
+    valuesOffset, indicesOffset = struct.unpack_from(">LL", data, offset + 4)
+    limit = struct.unpack_from(">H", data, offset + 12)[0]
+    return frameCount, valuesOffset & 0xFFFFFF, indicesOffset & 0xFFFFFF, limit
+
+def rotationValuesLength(dataSize, valuesOffset, indicesOffset):
+    """
+    Amount of values in the rotation values table: up to the indices table if it is after the values,
+    else up to the end of data
+    """
+    length = int((indicesOffset - valuesOffset) / 2)
+    if length <= 0:
+        length = (dataSize - valuesOffset) // 2
+    return min(length, max(0, (dataSize - valuesOffset) // 2))
+
+def decodeAnimation(data, offset, boneCount):
+    """
+    Decode the animation with its header at offset in data (bytes-like) for boneCount bones.
+    Indices below the limit from the header select the same value on every frame,
+    other indices are incremented every frame.
+    Returns (translation, rotations, valid):
+    - translation: (frames, 3) int16 array of the root limb translation
+    - rotations: (frames, boneCount, 3) int16 array of X, Y, Z rotations (0x10000 per turn)
+    - valid: (frames, boneCount) bool array, False where a bone has no rotation (no indices
+      for that bone, or indices out of the values table), rotations are 0 there
+    Translation values with indices out of the values table are 0.
+    """
+    frameCount, valuesOffset, indicesOffset, limit = readAnimationHeader(data, offset)
+    if frameCount <= 0:
+        return np.zeros((0, 3), dtype=np.int16), np.zeros((0, boneCount, 3), dtype=np.int16), np.zeros((0, boneCount), dtype=bool)
+    size = len(data)
+    valuesLength = rotationValuesLength(size, valuesOffset, indicesOffset)
+    values = np.frombuffer(data, dtype=">i2", count=valuesLength, offset=valuesOffset) if valuesLength else np.zeros(1, dtype=">i2")
+    # indices for the root translation, then for the rotation of each bone present in data
+    indexedBoneCount = min(boneCount, max(0, (size - indicesOffset - 12) // 6 + 1))
+    indices = np.frombuffer(data, dtype=">i2", count=3 * (1 + indexedBoneCount), offset=indicesOffset).astype(np.int64).reshape(-1, 3)
+    frames = np.arange(frameCount)
+    indices = indices[None, :, :] + np.where(indices >= limit, frames[:, None, None], 0)
+    inRange = (indices >= 0) & (indices < valuesLength)
+    tracks = np.where(inRange, values[np.where(inRange, indices, 0)], 0).astype(np.int16)
+
+    translation = tracks[:, 0]
+    rotations = np.zeros((frameCount, boneCount, 3), dtype=np.int16)
+    valid = np.zeros((frameCount, boneCount), dtype=bool)
+    valid[:, :indexedBoneCount] = np.all(inRange[:, 1:], axis=2)
+    rotations[:, :indexedBoneCount] = np.where(valid[:, :indexedBoneCount, None], tracks[:, 1:], 0)
+    return translation, rotations, valid
+
+def decodeAnimationFile(path, offset, boneCount):
+    """
+    decodeAnimation for the animation at offset in the file at path, which is memory-mapped
+    """
+    with open(path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return decodeAnimation(data, offset, boneCount)
+
+def findPythonInterpreter(candidates):
+    """
+    The first of candidates (paths, or None) that is a Python interpreter, or None.
+    Only the name is checked, to not start Blender itself as a worker (sys.executable in Blender 2.80-2.90)
+    """
+    for python in candidates:
+        if python and os.path.basename(python).lower().startswith("python"):
+            return python
+    return None
+
+def decodeAnimationsInWorkers(python, path, offsets, boneCount, workerCount):
+    """
+    decodeAnimationFile for each offset, in up to workerCount processes started with the python interpreter.
+    Workers run this file as a script (see workerMain), isolated (-I) so they import nothing from the caller:
+    no bpy, no addon, no __main__ script. Nothing is changed in the calling process.
+    Returns the results in the same order as offsets, raises if a worker could not be started or failed
+    """
+    path = os.path.abspath(path)
+    workerCount = max(1, min(workerCount, len(offsets)))
+    # consecutive offsets for each worker, so results only need to be concatenated
+    chunks = [offsets[k * len(offsets) // workerCount:(k + 1) * len(offsets) // workerCount] for k in range(workerCount)]
+    workers = []
+    try:
+        for chunk in chunks:
+            workers.append(subprocess.Popen([python, "-I", os.path.abspath(__file__)],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                # no console window for each worker on Windows
+                creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)))
+        def communicate(worker, chunk):
+            return worker.communicate(pickle.dumps((path, chunk, boneCount)))[0]
+        # workers are fed and read at the same time, from threads
+        with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+            outputs = list(executor.map(communicate, workers, chunks))
+    finally:
+        for worker in workers:
+            if worker.poll() is None:
+                worker.kill()
+                worker.wait()
+    decoded = []
+    for worker, output in zip(workers, outputs):
+        if worker.returncode != 0:
+            raise RuntimeError(f"Animation decoding worker exited with code {worker.returncode}")
+        decoded.extend(pickle.loads(output))
+    return decoded
+
+def workerMain():
+    """
+    Worker process for decodeAnimationsInWorkers: reads (path, offsets, boneCount) from stdin,
+    writes the list of decodeAnimationFile results to stdout
+    """
+    path, offsets, boneCount = pickle.load(sys.stdin.buffer)
+    decoded = [decodeAnimationFile(path, offset, boneCount) for offset in offsets]
+    pickle.dump(decoded, sys.stdout.buffer, protocol=pickle.HIGHEST_PROTOCOL)
+    sys.stdout.buffer.flush()
+
+def reduceTrack(track, linear=True):
+    """
+    Frames to key for a (frames, ...) integer track, with exact integer comparisons:
+    only the first frame if every frame has the same values as it, or (if linear) only the first and last frames
+    if the values change by the same amount every frame
+    Returns (indices of the frames to key, if they should be interpolated linearly)
+    """
+    track = np.asarray(track).astype(np.int64)
+    frameCount = len(track)
+    if frameCount and np.all(track == track[0]):
+        return np.zeros(1, dtype=np.int64), False
+    if linear and frameCount > 2:
+        steps = np.diff(track, axis=0)
+        if np.all(steps == steps[0]):
+            return np.array([0, frameCount - 1]), True
+    return np.arange(frameCount), False
+
+def eulerXYZToQuaternions(angles):
+    """
+    Convert (..., 3) arrays of X, Y, Z angles in radians (rotating around X, then Y, then Z like Euler "XYZ")
+    to (..., 4) arrays of W, X, Y, Z quaternions
+    """
+    half = angles / 2
+    cx, cy, cz = np.cos(half).transpose((-1, *range(half.ndim - 1)))
+    sx, sy, sz = np.sin(half).transpose((-1, *range(half.ndim - 1)))
+    return np.stack((
+        cx * cy * cz + sx * sy * sz,
+        sx * cy * cz - cx * sy * sz,
+        cx * sy * cz + sx * cy * sz,
+        cx * cy * sz - sx * sy * cz,
+    ), axis=-1)
+
+def makeQuaternionsContinuous(quaternions):
+    """Negate quaternions in a (n, 4) array as needed for each to be in the same hemisphere as the previous one"""
+    dots = np.einsum("ij,ij->i", quaternions[1:], quaternions[:-1])
+    signs = np.cumprod(np.concatenate(([1], np.where(dots < 0, -1, 1))))
+    return quaternions * signs[:, None]
+
+if __name__ == "__main__":
+    workerMain()
@@ -0,0 +1,184 @@
+# zelda64-import-blender
+# Headless batch import, run with:
+#   blender -b --python batch_import.py -- [options] INPUT [INPUT ...]
+#
+# Each INPUT is a .zobj/.zroom/.zmap file or a directory containing some.
+# One Blender process is started per input file (up to --jobs at once), each
+# imports its file with the same operator and options as an interactive
+# import, then saves the result to its own .blend file.
+
+import argparse
+import ast
+import csv
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import bpy
+
+import_extensions = (".zobj", ".zroom", ".zmap")
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="blender -b --python batch_import.py --",
+        description="Import Zelda64 files in batch, writing one .blend per file",
+    )
+    parser.add_argument("inputs", nargs="*", help="Files, or directories to import all .zobj/.zroom/.zmap files from")
+    parser.add_argument("--file-list", help="Text file listing files to import, one per line")
+    parser.add_argument("--recursive", action="store_true", help="Also look for files in subdirectories of input directories")
+    parser.add_argument("-o", "--output", help="Directory to write .blend files and the summary to (default: next to each input)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Amount of Blender processes to run at once (default: one per core)")
+    parser.add_argument("--summary", help="Path of the summary CSV (default: batch_import_summary.csv in the output directory)")
+    parser.add_argument("--blender", default=bpy.app.binary_path, help="Blender executable to use for workers")
+    parser.add_argument("--timeout", type=float, default=None, help="Seconds after which a worker is killed")
+    parser.add_argument("--set", dest="options", action="append", default=[], metavar="OPTION=VALUE",
+                        help="Set an import option as named by the operator, e.g. --set import_strategy=SMART --set load_animations=False")
+    # used by the driver to start workers
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--blend", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def parseOptions(options):
+    keywords = {}
+    for option in options:
+        if "=" not in option:
+            raise ValueError(f"Expected OPTION=VALUE, got {option!r}")
+        key, value = option.split("=", 1)
+        try:
+            keywords[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            keywords[key] = value
+    return keywords
+
+def collectInputs(args):
+    inputs = list(args.inputs)
+    if args.file_list:
+        with open(args.file_list, "r") as file:
+            inputs.extend(line.strip() for line in file if line.strip())
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                files.extend(os.path.join(dirpath, f) for f in sorted(filenames) if f.lower().endswith(import_extensions))
+                if not args.recursive:
+                    break
+                dirnames.sort()
+        else:
+            files.append(path)
+    return [os.path.abspath(f) for f in files]
+
+def blendPathFor(filepath, output):
+    directory, name = os.path.split(filepath)
+    if output:
+        # keep the parent directory name, rooms of different scenes are often named alike
+        name = f"{os.path.basename(directory)}_{name}"
+        directory = output
+    return os.path.join(directory, f"{name}.blend")
+
+def registerAddon():
+    if hasattr(bpy.types, "IMPORT_SCENE_OT_zobj"):
+        return
+    addon_dir = os.path.dirname(os.path.abspath(__file__))
+    spec = importlib.util.spec_from_file_location(
+        "zelda64_import_batch", os.path.join(addon_dir, "__init__.py"),
+        submodule_search_locations=[addon_dir])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    module.register()
+
+def runWorker(args):
+    result = {"file": args.worker, "blend": args.blend, "status": "ok", "error": "", "import_seconds": 0.0}
+    try:
+        registerAddon()
+        bpy.ops.wm.read_factory_settings(use_empty=True)
+        directory, name = os.path.split(args.worker)
+        time_start = time.time()
+        try:
+            bpy.ops.import_scene.zobj(
+                filepath=args.worker, directory=directory, files=[{"name": name}],
+                **parseOptions(args.options))
+        except RuntimeError as e:
+            # errors were reported by the operator, but it ran to completion
+            result["status"] = "error"
+            result["error"] = str(e).strip()
+        result["import_seconds"] = time.time() - time_start
+        os.makedirs(os.path.dirname(args.blend), exist_ok=True)
+        bpy.ops.wm.save_as_mainfile(filepath=args.blend)
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+    with open(args.result, "w") as file:
+        json.dump(result, file)
+    return result["status"] != "failed"
+
+def runFile(args, filepath):
+    blend = blendPathFor(filepath, args.output)
+    os.makedirs(os.path.dirname(blend), exist_ok=True)
+    result_path = f"{blend}.result.json"
+    log_path = f"{blend}.log"
+    command = [
+        args.blender, "-b", "--factory-startup",
+        "--python", os.path.abspath(__file__), "--",
+        "--worker", filepath, "--blend", blend, "--result", result_path,
+    ]
+    for option in args.options:
+        command += ["--set", option]
+    result = {"file": filepath, "blend": blend, "status": "failed", "error": "", "import_seconds": 0.0}
+    time_start = time.time()
+    try:
+        with open(log_path, "w") as log_file:
+            subprocess.run(command, stdout=log_file, stderr=subprocess.STDOUT, timeout=args.timeout)
+        with open(result_path, "r") as file:
+            result.update(json.load(file))
+        os.remove(result_path)
+    except subprocess.TimeoutExpired:
+        result["error"] = f"Timed out after {args.timeout} sec"
+    except OSError as e:
+        result["error"] = f"Worker did not report a result, see {log_path} ({e})"
+    result["total_seconds"] = time.time() - time_start
+    return result
+
+def runDriver(args):
+    files = collectInputs(args)
+    if not files:
+        print("batch_import: no files to import")
+        return False
+    jobs = max(1, min(args.jobs, len(files)))
+    print(f"batch_import: importing {len(files)} files with {jobs} workers")
+    results = []
+    time_start = time.time()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for result in executor.map(lambda f: runFile(args, f), files):
+            print(f"batch_import: {result['status']:6} {result['total_seconds']:8.2f} sec  {result['file']}"
+                  f"{'  ' + result['error'] if result['error'] else ''}")
+            results.append(result)
+    summary = args.summary
+    if not summary:
+        summary = os.path.join(args.output or os.getcwd(), "batch_import_summary.csv")
+    with open(summary, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=("file", "blend", "status", "import_seconds", "total_seconds", "error"))
+        writer.writeheader()
+        for result in results:
+            writer.writerow({key: result.get(key, "") for key in writer.fieldnames})
+    failed = sum(1 for result in results if result["status"] != "ok")
+    print(f"batch_import: done in {time.time() - time_start:.2f} sec, {len(results) - failed} ok, {failed} with errors, summary written to {summary}")
+    return failed == 0
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    args = parseArguments(argv)
+    if args.worker:
+        success = runWorker(args)
+    else:
+        success = runDriver(args)
+    sys.exit(0 if success else 1)
+
+if __name__ == "__main__":
+    main()
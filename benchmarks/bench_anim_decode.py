@@ -0,0 +1,104 @@
+# zelda64-import-blender
+# Time anim_decode.decodeAnimation against the former frame by frame, value by value reading, run with:
+#   python benchmarks/bench_anim_decode.py [--frames N] [--bones N] [--repeat N] [--file PATH --offset 0xOFFSET]
+#
+# Doesn't need Blender. Uses a synthetic animation (about half of the values constant, like actual animations)
+# unless --file and --offset give an animation header in an actual segment file (offset within the file).
+
+import argparse
+import os
+import random
+import struct
+import sys
+import time
+from struct import unpack_from
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anim_decode import decodeAnimation
+
+def formerDecode(data, offset, boneCount):
+    """The reading part of F3DZEX.buildAnimation before anim_decode, returning the same arrays as decodeAnimation"""
+    Limit = unpack_from(">H", data, offset + 12)[0]
+    frameTotal = unpack_from(">h", data, offset)[0]
+    rot_vals_addr, RotIndexoffset = unpack_from(">LL", data, offset + 4)
+    rot_vals_addr &= 0xFFFFFF
+    RotIndexoffset &= 0xFFFFFF
+    rot_vals_max_length = int((RotIndexoffset - rot_vals_addr) / 2)
+    if rot_vals_max_length < 0:
+        rot_vals_max_length = (len(data) - rot_vals_addr) // 2
+    rot_vals_cache = []
+    def rot_vals(index, errorDefault=0):
+        if index < 0 or (rot_vals_max_length and index >= rot_vals_max_length):
+            return errorDefault
+        if index >= len(rot_vals_cache):
+            rot_vals_cache.extend(unpack_from(">h", data, rot_vals_addr + j * 2)[0] for j in range(len(rot_vals_cache), index + 1))
+        return rot_vals_cache[index]
+    translations, rotations = [], []
+    for frame in range(frameTotal):
+        translation = unpack_from(">hhh", data, RotIndexoffset)
+        translations.append([rot_vals(v + frame if v >= Limit else v) for v in translation])
+        frameRotations = []
+        for bIndx in range(boneCount):
+            if RotIndexoffset + (bIndx * 6) + 10 + 2 > len(data):
+                frameRotations.append(None)
+                continue
+            rot_index = unpack_from(">hhh", data, RotIndexoffset + (bIndx * 6) + 6)
+            r = [rot_vals(v + frame if v >= Limit else v, None) for v in rot_index]
+            frameRotations.append(None if None in r else r)
+        rotations.append(frameRotations)
+    return translations, rotations
+
+def makeAnimation(frameCount, boneCount, seed=0):
+    rng = random.Random(seed)
+    channels = 3 + 3 * boneCount
+    limit = channels // 2
+    # constant values first (indices below limit), then frameCount values per animated channel
+    values = [rng.randint(-0x8000, 0x7FFF) for _ in range(limit + (channels - limit) * frameCount)]
+    indices = list(range(limit)) + [limit + k * frameCount for k in range(channels - limit)]
+    rng.shuffle(indices)
+    valuesData = struct.pack(f">{len(values)}h", *values)
+    header = struct.pack(">hhLLHH", frameCount, 0, 0x06000010, 0x06000000 | (16 + len(valuesData)), limit, 0)
+    return header + valuesData + struct.pack(f">{channels}h", *indices)
+
+def bench(function, repeat):
+    best = None
+    for _ in range(repeat):
+        time_start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - time_start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(prog="python benchmarks/bench_anim_decode.py")
+    parser.add_argument("--frames", type=int, default=100, help="Frames of the synthetic animation (default: 100)")
+    parser.add_argument("--bones", type=int, default=21, help="Bones to decode (default: 21)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each decoder, the best time is kept (default: 5)")
+    parser.add_argument("--file", help="Segment file to read an animation from instead")
+    parser.add_argument("--offset", type=lambda v: int(v, 0), default=0, help="Offset of the animation header in --file")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as file:
+            data = file.read()
+        offset = args.offset
+    else:
+        data = makeAnimation(args.frames, args.bones)
+        offset = 0
+
+    translation, rotations, valid = decodeAnimation(data, offset, args.bones)
+    formerTranslations, formerRotations = formerDecode(data, offset, args.bones)
+    same = translation.tolist() == formerTranslations and all(
+        (r.tolist() if v else None) == f
+        for frameRotations, frameValid, formerFrame in zip(rotations, valid, formerRotations)
+        for r, v, f in zip(frameRotations, frameValid, formerFrame))
+
+    seconds = bench(lambda: decodeAnimation(data, offset, args.bones), args.repeat)
+    formerSeconds = bench(lambda: formerDecode(data, offset, args.bones), args.repeat)
+    print(f"{len(translation)} frames, {args.bones} bones: decodeAnimation {seconds * 1000:.3f} ms, "
+          f"former {formerSeconds * 1000:.3f} ms ({formerSeconds / seconds:.1f}x), results {'identical' if same else 'DIFFERENT'}")
+    sys.exit(0 if same else 1)
+
+if __name__ == "__main__":
+    main()
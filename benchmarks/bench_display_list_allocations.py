@@ -0,0 +1,101 @@
+# zelda64-import-blender
+# Memory allocated per display list command while importing, run with:
+#   blender -b --factory-startup --python benchmarks/bench_display_list_allocations.py -- [--set OPTION=VALUE] FILE [FILE ...]
+#
+# Imports each file with every opcode handler of F3DZEX (see F3DZEX.makeOpcodeHandlers) wrapped to measure,
+# for each command executed, with tracemalloc and sys.getallocatedblocks:
+# - blocks: memory blocks still allocated after the command (objects it kept)
+# - bytes: bytes still allocated after the command
+# - peak: highest amount of bytes allocated during the command, including temporary objects (Python 3.9+)
+# Amounts are per command, excluding display lists called by G_DL/LOD commands (counted with their own commands).
+# G_ENDDL (0xDF) includes creating the Blender mesh.
+
+import os
+import sys
+import tracemalloc
+
+import bpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from blender_benchmark import makeArgumentParser, parseArguments, registerAddon
+
+class AllocationStats:
+    def __init__(self):
+        self.stats = {} # opcode -> [commands, blocks, bytes, peak]
+        self.stack = [] # [blocks, bytes, peak] of called commands, for each command being executed
+        self.resetPeak = getattr(tracemalloc, "reset_peak", None)
+        self.overhead = (0, 0)
+
+    def measure(self, opcode, handler, ctx, i):
+        children = [0, 0, 0]
+        self.stack.append(children)
+        blocks = sys.getallocatedblocks()
+        current = tracemalloc.get_traced_memory()[0]
+        if self.resetPeak:
+            self.resetPeak()
+        result = handler(ctx, i)
+        currentAfter, peak = tracemalloc.get_traced_memory()
+        blocksAfter = sys.getallocatedblocks()
+        self.stack.pop()
+        total = (blocksAfter - blocks - self.overhead[0], currentAfter - current - self.overhead[1], max(0, peak - current))
+        if self.stack:
+            for k in range(3):
+                self.stack[-1][k] += total[k]
+        stats = self.stats.setdefault(opcode, [0, 0, 0, 0])
+        stats[0] += 1
+        stats[1] += total[0] - children[0]
+        stats[2] += total[1] - children[1]
+        # peaks of called display lists aren't additive, only count the command itself when it calls none
+        stats[3] += total[2] if not children[2] else 0
+        return result
+
+    def calibrate(self):
+        """Measure what measuring a command that does nothing gives, to subtract it"""
+        self.overhead = (0, 0)
+        runs = 1000
+        for _ in range(runs):
+            self.measure(-1, lambda ctx, i: None, None, 0)
+        stats = self.stats.pop(-1)
+        self.overhead = (round(stats[1] / runs), round(stats[2] / runs))
+
+    def wrap(self, opcode, handler):
+        def measured(ctx, i):
+            return self.measure(opcode, handler, ctx, i)
+        return measured
+
+    def report(self, names):
+        print(f"{'opcode':8} {'handler':20} {'commands':>9} {'blocks/cmd':>11} {'bytes/cmd':>10} {'peak/cmd':>9}")
+        for opcode, (commands, blocks, size, peak) in sorted(self.stats.items()):
+            print(f"0x{opcode:02X}     {names.get(opcode, 'opUnimplemented'):20} {commands:9} "
+                  f"{blocks / commands:11.2f} {size / commands:10.1f} "
+                  f"{peak / commands if self.resetPeak else float('nan'):9.1f}")
+        commands = sum(s[0] for s in self.stats.values())
+        if commands:
+            print(f"all      {'':20} {commands:9} {sum(s[1] for s in self.stats.values()) / commands:11.2f} "
+                  f"{sum(s[2] for s in self.stats.values()) / commands:10.1f}")
+
+def main():
+    args = parseArguments(makeArgumentParser("bench_display_list_allocations.py", ".zobj/.zroom/.zmap files to import"))
+
+    options, io_import_z64 = registerAddon(args.options)
+    F3DZEX = io_import_z64.F3DZEX
+
+    allocations = AllocationStats()
+    makeOpcodeHandlers = F3DZEX.makeOpcodeHandlers
+    def makeMeasuredOpcodeHandlers(self):
+        return [allocations.wrap(opcode, handler) for opcode, handler in enumerate(makeOpcodeHandlers(self))]
+    F3DZEX.makeOpcodeHandlers = makeMeasuredOpcodeHandlers
+
+    tracemalloc.start()
+    allocations.calibrate()
+    for filepath in args.files:
+        filepath = os.path.abspath(filepath)
+        bpy.ops.wm.read_factory_settings(use_empty=True)
+        directory, name = os.path.split(filepath)
+        bpy.ops.import_scene.zobj(filepath=filepath, directory=directory, files=[{"name": name}], **options)
+    tracemalloc.stop()
+    allocations.report(F3DZEX.opcodeHandlerNames)
+
+if __name__ == "__main__":
+    main()
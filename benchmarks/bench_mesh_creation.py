@@ -0,0 +1,89 @@
+# zelda64-import-blender
+# Compare building meshes with bmesh (bulk_mesh_creation=False) and with foreach_set (bulk_mesh_creation=True), run with:
+#   blender -b --factory-startup --python benchmarks/bench_mesh_creation.py -- [--repeat N] [--set OPTION=VALUE] FILE [FILE ...]
+#
+# Each file is imported with both paths into an empty scene, --repeat times each (the best time is kept).
+# Prints the import time and the time spent in Mesh.fillBMesh / Mesh.fillBulk for both,
+# and checks both paths made the same meshes: vertices, faces (degenerate faces are dropped by both),
+# material slots and indices, smooth flags, UVs and vertex colors.
+# Exits with status 1 if any file gives different meshes.
+
+import os
+import sys
+import time
+
+import bpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from blender_benchmark import makeArgumentParser, parseArguments, registerAddon
+
+def timeFills(io_import_z64, timings):
+    """Wrap Mesh.fillBMesh and Mesh.fillBulk to add the time spent in them to timings"""
+    Mesh = io_import_z64.Mesh
+    for name in ("fillBMesh", "fillBulk"):
+        fill = getattr(Mesh, name)
+        def timedFill(self, me, fill=fill, name=name):
+            time_start = time.perf_counter()
+            fill(self, me)
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - time_start
+        setattr(Mesh, name, timedFill)
+
+def meshSignature():
+    """Everything compared between both paths, for all meshes in the file"""
+    signature = {}
+    for me in bpy.data.meshes:
+        colors = me.vertex_colors["Col"].data if "Col" in me.vertex_colors else []
+        uvs = me.uv_layers["UVMap"].data if "UVMap" in me.uv_layers else []
+        signature[me.name] = (
+            [tuple(round(c, 4) for c in v.co) for v in me.vertices],
+            [tuple(p.vertices) for p in me.polygons],
+            [p.material_index for p in me.polygons],
+            [p.use_smooth for p in me.polygons],
+            [m.name if m else None for m in me.materials],
+            [tuple(round(c, 4) for c in l.uv) for l in uvs],
+            [tuple(round(c, 3) for c in l.color) for l in colors],
+        )
+    return signature
+
+def importFile(filepath, bulk, options):
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    directory, name = os.path.split(filepath)
+    time_start = time.perf_counter()
+    bpy.ops.import_scene.zobj(filepath=filepath, directory=directory, files=[{"name": name}],
+        bulk_mesh_creation=bulk, **options)
+    return time.perf_counter() - time_start
+
+def main():
+    parser = makeArgumentParser("bench_mesh_creation.py", ".zobj/.zroom/.zmap files, large rooms show the difference best")
+    parser.add_argument("--repeat", type=int, default=3, help="Imports per file and path, the best time is kept (default: 3)")
+    args = parseArguments(parser)
+
+    options, io_import_z64 = registerAddon(args.options)
+    timings = {}
+    timeFills(io_import_z64, timings)
+
+    different = 0
+    print(f"{'file':40} {'bmesh import':>13} {'bmesh fill':>11} {'bulk import':>12} {'bulk fill':>10} {'fill speedup':>13}  meshes")
+    for filepath in args.files:
+        filepath = os.path.abspath(filepath)
+        results = {}
+        for bulk, fillName in ((False, "fillBMesh"), (True, "fillBulk")):
+            best = None
+            for _ in range(args.repeat):
+                timings.clear()
+                seconds = importFile(filepath, bulk, options)
+                if best is None or seconds < best[0]:
+                    best = (seconds, timings.get(fillName, 0.0))
+            results[bulk] = best + (meshSignature(),)
+        same = results[False][2] == results[True][2]
+        if not same:
+            different += 1
+        speedup = results[False][1] / results[True][1] if results[True][1] else float("nan")
+        print(f"{os.path.basename(filepath):40} {results[False][0]:12.3f}s {results[False][1]:10.3f}s "
+              f"{results[True][0]:11.3f}s {results[True][1]:9.3f}s {speedup:12.1f}x  "
+              f"{len(results[True][2])} {'identical' if same else 'DIFFERENT'}")
+    sys.exit(1 if different else 0)
+
+if __name__ == "__main__":
+    main()
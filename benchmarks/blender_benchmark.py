@@ -0,0 +1,38 @@
+# zelda64-import-blender
+# What the benchmarks run in Blender share: command line parsing and registering the addon as batch_import.py does.
+# Not a benchmark itself, benchmarks add this directory to sys.path to import it (Blender doesn't for --python scripts).
+
+import argparse
+import importlib.util
+import os
+import sys
+
+def loadBatchImport():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "batch_import.py")
+    spec = importlib.util.spec_from_file_location("zelda64_batch_import", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def makeArgumentParser(script, filesHelp):
+    """Parser for files to import and --set OPTION=VALUE import options, add other arguments to it"""
+    parser = argparse.ArgumentParser(prog=f"blender -b --python benchmarks/{script} --")
+    parser.add_argument("files", nargs="+", help=filesHelp)
+    parser.add_argument("--set", dest="options", action="append", default=[], metavar="OPTION=VALUE",
+                        help="Set an import option, as with batch_import.py")
+    return parser
+
+def parseArguments(parser):
+    """Parse the arguments after -- in Blender's command line"""
+    return parser.parse_args(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+
+def registerAddon(optionStrings):
+    """
+    Register the addon with batch_import.registerAddon
+    Returns the import options from --set, and the io_import_z64 module (however the addon was registered)
+    """
+    batch_import = loadBatchImport()
+    batch_import.registerAddon()
+    options = batch_import.parseOptions(optionStrings)
+    io_import_z64 = next(module for name, module in sys.modules.items() if name.endswith(".io_import_z64"))
+    return options, io_import_z64
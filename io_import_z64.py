@@ -1,13 +1,35 @@
-import bpy, bmesh, os, struct
+import bpy, bmesh, hashlib, json, mmap, os, re, struct, sys, time
+import numpy as np
 
 from bpy.props import *
 from bpy_extras.image_utils import load_image
 from bpy_extras.node_shader_utils import PrincipledBSDFWrapper
+from bisect import bisect_left, bisect_right
 from math import *
 from struct import pack, unpack_from
 
 from mathutils import Vector, Euler, Quaternion, Matrix
 from .log import *
+from .anim_decode import (
+    decodeAnimation,
+    decodeAnimationFile,
+    decodeAnimationsInWorkers,
+    findPythonInterpreter,
+    eulerXYZToQuaternions,
+    makeQuaternionsContinuous,
+    reduceTrack
+)
+from .texture_decode import (
+    texel_bytes_per_pixel,
+    supported_formats,
+    decodeTexels,
+    decodePalette,
+    fallbackTexels,
+    fallbackPalette,
+    toTGAImageData,
+    toTGAPalette,
+    TextureCache
+)
 
 def splitOffset(offset):
     return offset >> 24, offset & 0x00FFFFFF
@@ -24,26 +46,153 @@ def validOffset(segment, offset):
         return False
     return True
 
+def mapFile(path):
+    """
+    Memory-map the file at path read-only, returns (mmap object, memoryview of it)
+    Empty files can't be mapped, (None, b"") is returned for them
+    """
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return None, b""
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapped, memoryview(mapped)
+
+class SegmentPool:
+    """
+    Segment files shared by all files imported in one operator execution, such as the scene file of several rooms.
+    Each file is mapped (see mapFile) and scanned (see F3DZEX.getSegmentIndex) only once.
+    acquire/release count the importers using a file, close unmaps files once no importer uses them.
+    """
+    def __init__(self):
+        self.entries = {} # path -> [mmap object, memoryview, users]
+        self.indexes = {} # path -> F3DZEX.getSegmentIndex result
+        self.digests = {} # path -> sha1 hex digest of the file contents
+
+    def getKey(self, path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def acquire(self, path):
+        key = self.getKey(path)
+        entry = self.entries.get(key)
+        if entry is None:
+            getLogger("SegmentPool.acquire").debug(f"Mapping shared segment file {path}")
+            entry = [*mapFile(path), 0]
+            self.entries[key] = entry
+        entry[2] += 1
+        return entry[1]
+
+    def release(self, path):
+        self.entries[self.getKey(path)][2] -= 1
+
+    def getIndex(self, path):
+        return self.indexes.get(self.getKey(path))
+
+    def setIndex(self, path, index):
+        self.indexes[self.getKey(path)] = index
+
+    def getDigest(self, path):
+        """sha1 hex digest of the (acquired) file contents, computed once per file"""
+        key = self.getKey(path)
+        digest = self.digests.get(key)
+        if digest is None:
+            digest = hashlib.sha1(self.entries[key][1]).hexdigest()
+            self.digests[key] = digest
+        return digest
+
+    def close(self):
+        log = getLogger("SegmentPool.close")
+        for key, (mapped, data, users) in list(self.entries.items()):
+            if users > 0:
+                log.warning(f"Shared segment file {key} is still used by {users} importers")
+                continue
+            del self.entries[key]
+            self.indexes.pop(key, None)
+            self.digests.pop(key, None)
+            if mapped:
+                try:
+                    data.release()
+                    mapped.close()
+                except BufferError:
+                    # still referenced, it will be unmapped once garbage collected
+                    log.debug(f"Shared segment file {key} mapping is still in use")
+
+class IntervalSet:
+    """
+    Set of integers stored as sorted, disjoint inclusive ranges (start, end).
+    Overlapping or adjacent ranges are merged when added.
+    """
+    __slots__ = ("starts", "ends")
+
+    def __init__(self):
+        self.starts, self.ends = [], []
+
+    def add(self, start, end):
+        # ranges overlapping or adjacent to [start, end] are starts[lo:hi]
+        lo = bisect_left(self.ends, start - 1)
+        hi = bisect_right(self.starts, end + 1)
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+
+    def covers(self, x):
+        k = bisect_right(self.starts, x) - 1
+        return k >= 0 and x <= self.ends[k]
+
+    def nextStart(self, x):
+        """Returns the smallest range start at or after x, or None"""
+        k = bisect_left(self.starts, x)
+        return self.starts[k] if k < len(self.starts) else None
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __repr__(self):
+        return f"IntervalSet({', '.join(f'0x{a:X}-0x{b:X}' for a, b in self)})"
+
 class Tile:
+    # tiles are updated by many display list commands, fields are modified in place instead of replaced
+    __slots__ = (
+        "current_texture_file_path", "write_error_encountered",
+        "texFmt", "texBytes", "texSiz", "lineSize",
+        "dims", "r_dims", "rect", "scale", "ratio", "mirror", "wrap",
+        "mask", "shift", "tshift", "offset",
+        "data", "palette",
+    )
+    # fields set by display list commands, the others are only used when creating the texture
+    stateFields = __slots__[2:]
+
     def __init__(self):
         self.current_texture_file_path = None
+        self.write_error_encountered = False
         self.texFmt, self.texBytes = 0x00, 0
         self.dims = [0, 0]
         self.r_dims = [0, 0]
         self.texSiz = 0
         self.lineSize = 0
-        self.rect = Vector([0, 0, 0, 0])
-        self.scale = Vector([1, 1])
-        self.ratio = Vector([1, 1])
+        self.rect = [0, 0, 0, 0] # x, y, z, w
+        self.scale = [1, 1]
+        self.ratio = [1, 1]
         self.mirror = [False, False]
         self.wrap = [False, False]
-        self.mask = Vector([0, 0])
-        self.shift = Vector([0, 0])
-        self.tshift = Vector([0, 0])
-        self.offset = Vector([0, 0])
+        self.mask = [0, 0]
+        self.shift = [0, 0]
+        self.tshift = [0, 0]
+        self.offset = [0, 0]
         self.data = 0x00000000
         self.palette = 0x00000000
 
+    def copy(self):
+        tile = Tile.__new__(Tile)
+        for name in Tile.__slots__:
+            value = getattr(self, name)
+            setattr(tile, name, value.copy() if isinstance(value, list) else value)
+        return tile
+
     def getFormatName(self):
         formats = {0: "RGBA", 1: "YUV", 2: "CI", 3: "IA", 4: "I"}
         sizes = {0: "4", 1: "8", 2: "16", 3: "32"}
@@ -58,7 +207,10 @@ class Tile:
             enable_clamp_tags, 
             enable_blender_clamp,
             fpath,
-            prefix=""
+            prefix="",
+            texture_cache=None,
+            write_texture_files=True,
+            images=None
         ):
         # TODO: texture files are written several times, at each usage
         log = getLogger("Tile.create")
@@ -83,68 +235,78 @@ class Tile:
             suffix += "#ClampY"
         self.current_texture_file_path = os.path.join(fpath, "textures", f"{prefix}{fmtName}_{self.data:08X}{f'_pal{self.palette:08X}' if self.texFmt == 2 else ''}{suffix}.tga")
 
-        try:
-            os.mkdir(os.path.join(fpath, "textures"))
-        except FileExistsError:
-            pass
-        except:
-            log.exception(f"Could not create textures directory {os.path.join(fpath, 'textures')}")
-            pass
-        if not os.path.isfile(self.current_texture_file_path):
-            log.debug(f"Writing texture {self.current_texture_file_path} (format 0x{self.texFmt:02X})")
-            with open(self.current_texture_file_path, "wb") as file:
-                self.write_error_encountered = False
-                if self.texFmt == 2:
-                    if self.texSiz not in (0, 1):
-                        log.error(f"Unknown texture format {self.texFmt} with pixel size {self.texSiz}")
-                    p = 16 if self.texSiz == 0 else 256
-                    file.write(pack("<BBBHHBHHHHBB",
-                        0,  # image comment length
-                        1,  # 1 = paletted
-                        1,  # 1 = indexed uncompressed colors
-                        0,  # index of first palette entry (?)
-                        p,  # amount of entries in palette
-                        32, # bits per pixel
-                        0,  # bottom left X (?)
-                        0,  # bottom left Y (?)
-                        w,  # width
-                        h,  # height
-                        8,  # pixel depth
-                        8   # 8 bits alpha hopefully?
-                    ))
-                    self.writePalette(file, segment, p)
-                else:
-                    file.write(pack("<BBBHHBHHHHBB",
-                        0, # image comment length
-                        0, # no palette
-                        2, # uncompressed Truecolor (24-32 bits)
-                        0, # irrelevant, no palette
-                        0, # irrelevant, no palette
-                        0, # irrelevant, no palette
-                        0, # bottom left X (?)
-                        0, # bottom left Y (?)
-                        w, # width
-                        h, # height
-                        32,# pixel depth
-                        8  # 8 bits alpha (?)
-                    ))
-                self.writeImageData(
-                    file,
+        if write_texture_files:
+            try:
+                os.mkdir(os.path.join(fpath, "textures"))
+            except FileExistsError:
+                pass
+            except:
+                log.exception(f"Could not create textures directory {os.path.join(fpath, 'textures')}")
+                pass
+            if not os.path.isfile(self.current_texture_file_path):
+                log.debug(f"Writing texture {self.current_texture_file_path} (format 0x{self.texFmt:02X})")
+                pixels, palette = self.decode(
                     segment,
-                    [b and replicate_tex_mirror_blender for b in self.mirror]
+                    [b and replicate_tex_mirror_blender for b in self.mirror],
+                    texture_cache
                 )
-            if self.write_error_encountered:
-                oldName = self.current_texture_file_path
-                oldNameDir, oldNameBase = os.path.split(oldName)
-                newName = os.path.join(oldNameDir, f"{prefix}fallback_{oldNameBase}")
-                log.warning(f"Moving failed texture file import from {oldName} to {newName}")
-                if os.path.isfile(newName):
-                    os.remove(newName)
-                os.rename(oldName, newName)
-                self.current_texture_file_path = newName
+                with open(self.current_texture_file_path, "wb") as file:
+                    if self.texFmt == 2:
+                        if self.texSiz not in (0, 1):
+                            log.error(f"Unknown texture format {self.texFmt} with pixel size {self.texSiz}")
+                        p = 16 if self.texSiz == 0 else 256
+                        file.write(pack("<BBBHHBHHHHBB",
+                            0,  # image comment length
+                            1,  # 1 = paletted
+                            1,  # 1 = indexed uncompressed colors
+                            0,  # index of first palette entry (?)
+                            p,  # amount of entries in palette
+                            32, # bits per pixel
+                            0,  # bottom left X (?)
+                            0,  # bottom left Y (?)
+                            w,  # width
+                            h,  # height
+                            8,  # pixel depth
+                            8   # 8 bits alpha hopefully?
+                        ))
+                        file.write(toTGAPalette(palette))
+                    else:
+                        file.write(pack("<BBBHHBHHHHBB",
+                            0, # image comment length
+                            0, # no palette
+                            2, # uncompressed Truecolor (24-32 bits)
+                            0, # irrelevant, no palette
+                            0, # irrelevant, no palette
+                            0, # irrelevant, no palette
+                            0, # bottom left X (?)
+                            0, # bottom left Y (?)
+                            w, # width
+                            h, # height
+                            32,# pixel depth
+                            8  # 8 bits alpha (?)
+                        ))
+                    file.write(toTGAImageData(pixels))
+                if self.write_error_encountered:
+                    oldName = self.current_texture_file_path
+                    oldNameDir, oldNameBase = os.path.split(oldName)
+                    newName = os.path.join(oldNameDir, f"{prefix}fallback_{oldNameBase}")
+                    log.warning(f"Moving failed texture file import from {oldName} to {newName}")
+                    if os.path.isfile(newName):
+                        os.remove(newName)
+                    os.rename(oldName, newName)
+                    self.current_texture_file_path = newName
 
         try:
-            img = load_image(self.current_texture_file_path)
+            if write_texture_files:
+                img = load_image(self.current_texture_file_path)
+            else:
+                img = self.createImage(
+                    segment,
+                    [b and replicate_tex_mirror_blender for b in self.mirror],
+                    texture_cache,
+                    images,
+                    prefix=prefix
+                )
 
             mtl_name = f"{prefix}mtl_{self.data:08X}"
             material = bpy.data.materials.new(name=mtl_name)
@@ -188,6 +350,32 @@ class Tile:
             log.exception(f"Failed to create material mtl_{self.data:08X}")
             return None
 
+    def createImage(self, segment, flip, texture_cache=None, images=None, prefix=""):
+        """
+        Create the image from decoded pixels directly, without writing a texture file
+        images is a dict of images already created, by name
+        """
+        log = getLogger("Tile.createImage")
+        name = os.path.basename(self.current_texture_file_path)
+        if images is not None and name in images:
+            return images[name]
+        log.debug(f"Creating image {name} (format 0x{self.texFmt:02X})")
+        pixels, palette = self.decode(segment, flip, texture_cache)
+        if palette is not None:
+            pixels = palette[pixels]
+        image_name = name
+        if self.write_error_encountered:
+            image_name = f"{prefix}fallback_{name}"
+            log.warning(f"Naming failed texture import {image_name}")
+        img = bpy.data.images.new(image_name, pixels.shape[1], pixels.shape[0], alpha=True)
+        # image pixels are RGBA floats, starting from the bottom row
+        img.pixels.foreach_set((pixels[::-1] / 255).astype(np.float32).ravel())
+        # generated images are lost when saving unless packed
+        img.pack()
+        if images is not None:
+            images[name] = img
+        return img
+
     def calculateSize(self, replicate_tex_mirror_blender):
         def pow2(val):
             i = 1
@@ -245,7 +433,7 @@ class Tile:
         
         self.lineSize << lineShift
         line_size = [self.lineSize, 0]
-        tile_size = (self.rect.z - self.rect.x + 1, self.rect.w - self.rect.y + 1)
+        tile_size = (self.rect[2] - self.rect[0] + 1, self.rect[3] - self.rect[1] + 1)
         mask_size = [1 << int(v) for v in self.mask]
 
         if line_size[0] > 0:
@@ -288,158 +476,109 @@ class Tile:
                 self.ratio[i] /= 2
             self.offset[i] = self.rect[i]
 
-        self.offset.y += 1.0
+        self.offset[1] += 1.0
 
-    def writePalette(self, file, segment, palSize):
-        log = getLogger("Tile.writePalette")
-        if not validOffset(segment, self.palette + palSize * 2 - 1):
-            log.error(f"Segment offsets 0x{self.palette:X}-0x{self.palette + palSize * 2 - 1:X} are invalid, writing black palette to {self.current_texture_file_path} (has the segment data been loaded?)")
-            for _ in range(palSize):
-                file.write(pack("L", 0))
-            self.write_error_encountered = True
-            return
-        seg, offset = splitOffset(self.palette)
-        for i in range(palSize):
-            color = unpack_from(">H", segment[seg], offset + i * 2)[0]
-            r = int(255/31 * ((color >> 11) & 0b11111))
-            g = int(255/31 * ((color >> 6) & 0b11111))
-            b = int(255/31 * ((color >> 1) & 0b11111))
-            a = 255 * (color & 1)
-            file.write(pack("BBBB", b, g, r, a))
-
-    def writeImageData(self, file, segment, flip):
-        log = getLogger("Tile.writeImageData")
+    def decode(self, segment, flip, texture_cache=None):
+        """
+        Decode this texture (and its palette for CI formats) as done by texture_decode.decodeTexels / decodePalette
+        Returns (pixels, palette), palette is None for non-CI formats
+        Invalid data results in fallback pixels/palette and write_error_encountered being set
+        """
+        log = getLogger("Tile.decode")
+        self.write_error_encountered = False
         if self.texSiz <= 3:
-            bpp = (0.5,1,2,4)[self.texSiz] # bytes (not bits) per pixel
+            bpp = texel_bytes_per_pixel[self.texSiz]
         else:
             log.warning(f"Unknown texSiz {self.texSiz} for texture {self.current_texture_file_path}, defaulting to 4 bytes per pixel")
             bpp = 4
-        lineSize = self.r_dims[0] * bpp
-        writeFallbackData = False
-        if not validOffset(segment, self.data + int(self.r_dims[1] * lineSize) - 1):
-            log.error(f"Segment offsets 0x{self.data:X}-0x{self.data + int(self.r_dims[1] * lineSize) - 1:X} are invalid, writing default fallback colors to {self.current_texture_file_path} (has the segment data been loaded?)")
-            writeFallbackData = True
-        if (self.texFmt,self.texSiz) not in (
-            (0,2), (0,3), # RGBA16, RGBA32
-            #(1,-1), # YUV ? "not used in z64 games"
-            (2,0), (2,1), # CI4, CI8
-            (3,0), (3,1), (3,2), # IA4, IA8, IA16
-            (4,0), (4,1), # I4, I8
-        ):
+        texelsLength = int(self.r_dims[1] * self.r_dims[0] * bpp)
+        palSize = (16 if self.texSiz == 0 else 256) if self.texFmt == 2 else 0
+        validPalette = True
+        if palSize and not validOffset(segment, self.palette + palSize * 2 - 1):
+            log.error(f"Segment offsets 0x{self.palette:X}-0x{self.palette + palSize * 2 - 1:X} are invalid, writing black palette to {self.current_texture_file_path} (has the segment data been loaded?)")
+            validPalette = False
+        validTexels = True
+        if not validOffset(segment, self.data + texelsLength - 1):
+            log.error(f"Segment offsets 0x{self.data:X}-0x{self.data + texelsLength - 1:X} are invalid, writing default fallback colors to {self.current_texture_file_path} (has the segment data been loaded?)")
+            validTexels = False
+        if (self.texFmt,self.texSiz) not in supported_formats:
             log.error(f"Unknown fmt/siz combination {self.texFmt}/{self.texSiz} ({self.getFormatName()}?)")
-            writeFallbackData = True
-        if writeFallbackData:
-            size = self.r_dims[0] * self.r_dims[1]
-            for x in [2 if f else 1 for f in flip]:
-                size *= x
-            for _ in range(size):
-                if self.texFmt == 2: # CI (paletted)
-                    file.write(pack("B", 0))
-                else:
-                    file.write(pack(">L", 0x000000FF))
-            self.write_error_encountered = True
-            return
-        seg, offset = splitOffset(self.data)
+            validTexels = False
 
-        height_range = range(self.r_dims[1])
-        if flip[1]:
-            height_range = list(height_range) + list(reversed(height_range))
+        seg, offset = splitOffset(self.data)
+        palSeg, palOffset = splitOffset(self.palette)
+        key = None
+        if texture_cache and validTexels and validPalette:
+            buffers = [segment[seg][offset:offset + texelsLength]]
+            if palSize:
+                buffers.append(segment[palSeg][palOffset:palOffset + palSize * 2])
+            key = TextureCache.makeKey(buffers, (self.texFmt, self.texSiz, self.r_dims[0], self.r_dims[1], flip[0], flip[1]))
+            cached = texture_cache.get(key)
+            if cached:
+                log.trace(f"Using cached texture {key} for {self.current_texture_file_path}")
+                return cached
+
+        if not palSize:
+            palette = None
+        elif validPalette:
+            palette = decodePalette(segment[palSeg], palOffset, palSize)
         else:
-            height_range = reversed(height_range)
-        
-        for i in height_range:
-            off = offset + int(i * lineSize)
-            line = []
-            j = 0
-            while j < int(self.r_dims[0] * bpp):
-                if bpp < 2: # 0.5, 1
-                    color = unpack_from("B", segment[seg], off + int(floor(j)))[0]
-                    if bpp == 0.5:
-                        color = ((color >> 4) if j % 1 == 0 else color) & 0xF
-                elif bpp == 2:
-                    color = unpack_from(">H", segment[seg], off + j)[0]
-                else: # 4
-                    color = unpack_from(">L", segment[seg], off + j)[0]
-                if self.texFmt == 0: # RGBA
-                    if self.texSiz == 2: # RGBA16
-                        r = ((color >> 11) & 0b11111) * 255 // 31
-                        g = ((color >> 6) & 0b11111) * 255 // 31
-                        b = ((color >> 1) & 0b11111) * 255 // 31
-                        a = (color & 1) * 255
-                    elif self.texSiz == 3: # RGBA32
-                        r = (color >> 24) & 0xFF
-                        g = (color >> 16) & 0xFF
-                        b = (color >> 8) & 0xFF
-                        a = color & 0xFF
-                elif self.texFmt == 2: # CI
-                    if self.texSiz == 0: # CI4
-                        p = color
-                    elif self.texSiz == 1: # CI8
-                        p = color
-                elif self.texFmt == 3: # IA
-                    if self.texSiz == 0: # IA4
-                        r = g = b = (color >> 1) * 255 // 7
-                        a = (color & 1) * 255
-                    elif self.texSiz == 1: # IA8
-                        r = g = b = (color >> 4) * 255 // 15
-                        a = (color & 0xF) * 255 // 15
-                    elif self.texSiz == 2: # IA16
-                        r = g = b = color >> 8
-                        a = color & 0xFF
-                elif self.texFmt == 4: # I
-                    if self.texSiz == 0: # I4
-                        r = g = b = a = color * 255 // 15
-                    elif self.texSiz == 1: # I8
-                        r = g = b = a = color
-                try:
-                    if self.texFmt == 2: # CI
-                        line.append(p)
-                    else:
-                        line.append((b << 24) | (g << 16) | (r << 8) | a)
-                except UnboundLocalError:
-                    log.error(f"Unknown format texFmt {self.texFmt} texSiz {self.texSiz}")
-                    raise
-                """
-                if self.texFmt == 0x40 or self.texFmt == 0x48 or self.texFmt == 0x50:
-                    line.append(a)
-                else:
-                    line.append((b << 24) | (g << 16) | (r << 8) | a)
-                """
-                j += bpp
-            if self.texFmt == 2: # CI # in (0x40, 0x48, 0x50):
-                file.write(pack("B" * len(line), *line))
-            else:
-                file.write(pack(">" + "L" * len(line), *line))
-            if flip[0]:
-                line.reverse()
-                if self.texFmt == 2: # CI # in (0x40, 0x48, 0x50):
-                    file.write(pack("B" * len(line), *line))
-                else:
-                    file.write(pack(">" + "L" * len(line), *line))
-
-
-class Vertex:
-    def __init__(self):
-        self.pos = Vector([0, 0, 0])
-        self.uv = Vector([0, 0])
-        self.normal = Vector([0, 0, 0])
-        self.color = [0, 0, 0, 0]
-        self.limb = None
-
-    def read(self, segment, offset, scale_factor):
-        log = getLogger("Vertex.read")
-        if not validOffset(segment, offset + 16):
-            log.warning(f"Invalid segmented offset 0x{offset + 16:X} for vertex")
-            return
-        seg, offset = splitOffset(offset)
-        self.pos = Vector(unpack_from(">hhh", segment[seg], offset)).xzy
-        self.pos.y = -self.pos.y
-        self.pos *= scale_factor
-        self.uv = Vector(unpack_from(">hh", segment[seg], offset + 8))
-        self.normal = Vector(unpack_from("bbb", segment[seg], offset + 12)).xzy
-        self.normal.y = -self.normal.y
-        self.normal /= 128
-        self.color = [min(segment[seg][offset + 12 + i] / 255, 1.0) for i in range(4)]
+            palette = fallbackPalette(palSize)
+            self.write_error_encountered = True
+        if validTexels:
+            pixels = decodeTexels(segment[seg], offset, self.texFmt, self.texSiz, self.r_dims[0], self.r_dims[1], flip)
+        else:
+            pixels = fallbackTexels(self.texFmt, self.r_dims[0], self.r_dims[1], flip)
+            self.write_error_encountered = True
+        if key:
+            texture_cache.put(key, pixels, palette)
+        return pixels, palette
+
+
+class VertexBuffer:
+    """The RSP vertex buffer, each attribute is a preallocated array with one row per vertex"""
+    __slots__ = ("pos", "uv", "normal", "color", "limb")
+
+    def __init__(self, size=32):
+        self.pos = np.zeros((size, 3), dtype=np.float32)
+        self.uv = np.zeros((size, 2), dtype=np.float32)
+        self.normal = np.zeros((size, 3), dtype=np.float32)
+        self.color = np.zeros((size, 4))
+        self.limb = [None] * size
+
+    def copy(self):
+        vbuf = VertexBuffer.__new__(VertexBuffer)
+        vbuf.pos, vbuf.uv, vbuf.normal, vbuf.color = self.pos.copy(), self.uv.copy(), self.normal.copy(), self.color.copy()
+        vbuf.limb = self.limb.copy()
+        return vbuf
+
+
+# Vtx as loaded by G_VTX, big-endian
+# the last 4 bytes are either a normal (signed) and alpha, or a color (unsigned)
+vertex_dtype = np.dtype([
+    ("pos", ">i2", 3),
+    ("flag", ">u2"),
+    ("uv", ">i2", 2),
+    ("rgba", "u1", 4),
+])
+
+def readVertices(segment, offset, count, scale_factor):
+    """
+    Read count vertices at segmented offset, returns (pos, uv, normal, color) arrays with one row per vertex
+    pos and normal are converted to Blender axes, pos is scaled by scale_factor
+    """
+    seg, offset = splitOffset(offset)
+    vertices = np.frombuffer(segment[seg], dtype=vertex_dtype, count=count, offset=offset)
+    # x, y, z -> x, -z, y
+    pos = vertices["pos"][:, (0, 2, 1)].astype(np.float32)
+    pos[:, 1] = -pos[:, 1]
+    pos *= np.float32(scale_factor)
+    uv = vertices["uv"].astype(np.float32)
+    normal = vertices["rgba"][:, (0, 2, 1)].view(np.int8).astype(np.float32)
+    normal[:, 1] = -normal[:, 1]
+    normal /= 128
+    color = vertices["rgba"] / 255
+    return pos, uv, normal, color
 
 
 class Mesh:
@@ -447,23 +586,27 @@ class Mesh:
         self.verts, self.uvs, self.colors, self.faces = [], [], [], []
         self.faces_use_smooth = []
         self.vgroups = {}
+        self.contentKey = None # see getContentKey
         # import normals
         self.normals = []
+        # position -> index of the first vertex at that position in self.verts
+        self.verts_index = {}
 
-    def create(self, name_format, hierarchy, offset, use_normals, prefix=""):
-        log = getLogger("Mesh.create")
-        if len(self.faces) == 0:
-            log.trace(f"Skipping empty mesh {offset:08X}")
-            if self.verts:
-                log.warning("Discarding unused vertices, no faces")
-            return
-        log.trace(f"Creating mesh {offset:08X}")
+    def findVert(self, pos):
+        return self.verts_index.get(pos)
 
-        me_name = prefix + (name_format % f"me_{offset:08X}")
-        me = bpy.data.meshes.new(me_name)
-        ob = bpy.data.objects.new(f"{prefix}{name_format % f'ob_{offset:08X}'}", me)
-        bpy.context.scene.collection.objects.link(ob)
-        bpy.context.view_layer.objects.active = ob
+    def addVert(self, pos):
+        self.verts.append(pos)
+        index = len(self.verts) - 1
+        self.verts_index.setdefault(pos, index)
+        return index
+
+    def popVert(self):
+        pos = self.verts.pop()
+        if self.verts_index.get(pos) == len(self.verts):
+            del self.verts_index[pos]
+
+    def fillBMesh(self, me):
         bm = bmesh.new()
         
         for vert in self.verts:
@@ -499,6 +642,87 @@ class Mesh:
         bm.to_mesh(me)
         bm.free()
 
+    def fillBulk(self, me):
+        """Same as fillBMesh, but setting all data at once with foreach_set"""
+        faces = np.array(self.faces, dtype=np.int32).reshape(-1, 3)
+        # Don't make a triangle if it's between only two verts
+        keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])
+        keep_indices = np.flatnonzero(keep)
+        face_count = len(keep_indices)
+
+        materials = self.uvs[0::4]
+        material_indices = np.zeros(face_count, dtype=np.int32)
+        material_slots = {}
+        for i, face_index in enumerate(keep_indices):
+            material = materials[face_index]
+            if material:
+                if material.name not in material_slots:
+                    material_slots[material.name] = len(me.materials)
+                    me.materials.append(material)
+                material_indices[i] = material_slots[material.name]
+        uvs = np.array([uv for x in range(0, len(self.uvs), 4) for uv in self.uvs[x+1:x+4]], dtype=np.float32).reshape(-1, 3, 2)
+        colors = np.array(self.colors, dtype=np.float32).reshape(-1, 3, 4)
+
+        me.vertices.add(len(self.verts))
+        me.vertices.foreach_set("co", np.array(self.verts, dtype=np.float32).ravel())
+        me.loops.add(face_count * 3)
+        me.loops.foreach_set("vertex_index", faces[keep].ravel())
+        me.polygons.add(face_count)
+        me.polygons.foreach_set("loop_start", np.arange(0, face_count * 3, 3, dtype=np.int32))
+        me.polygons.foreach_set("loop_total", np.full(face_count, 3, dtype=np.int32))
+        me.polygons.foreach_set("use_smooth", [self.faces_use_smooth[i] for i in keep_indices])
+        me.polygons.foreach_set("material_index", material_indices)
+        me.vertex_colors.new(name="Col").data.foreach_set("color", colors[keep].ravel())
+        me.uv_layers.new(name="UVMap").data.foreach_set("uv", uvs[keep].ravel())
+        me.update(calc_edges=True)
+
+    def getContentKey(self):
+        """Hash of everything the created mesh is made from, meshes with the same key are identical"""
+        if self.contentKey is None:
+            materials = [material.name if material else None for material in self.uvs[0::4]]
+            uvs = [uv for x in range(0, len(self.uvs), 4) for uv in self.uvs[x+1:x+4]]
+            colors = [tuple(color) for color in self.colors]
+            vgroups = sorted(self.vgroups.items())
+            content = (self.verts, self.faces, materials, uvs, colors, self.faces_use_smooth, self.normals, vgroups)
+            self.contentKey = hashlib.sha1(repr(content).encode()).digest()
+        return self.contentKey
+
+    def create(self, name_format, hierarchy, offset, use_normals, prefix="", bulk=True, instances=None):
+        """
+        If instances is a dict, meshes created are stored in it and an identical mesh
+        (same offset and content) created later is linked to the same mesh data
+        """
+        log = getLogger("Mesh.create")
+        if len(self.faces) == 0:
+            log.trace(f"Skipping empty mesh {offset:08X}")
+            if self.verts:
+                log.warning("Discarding unused vertices, no faces")
+            return
+        ob_name = f"{prefix}{name_format % f'ob_{offset:08X}'}"
+        if instances is not None:
+            instanceKey = (offset, prefix, use_normals, hierarchy, self.getContentKey())
+            me = instances.get(instanceKey)
+            if me is not None:
+                log.trace(f"Linking mesh {offset:08X} to existing {me.name}")
+                ob = bpy.data.objects.new(ob_name, me)
+                bpy.context.scene.collection.objects.link(ob)
+                bpy.context.view_layer.objects.active = ob
+                self.setupObject(ob, hierarchy)
+                return
+        log.trace(f"Creating mesh {offset:08X}")
+
+        me_name = prefix + (name_format % f"me_{offset:08X}")
+        me = bpy.data.meshes.new(me_name)
+        ob = bpy.data.objects.new(ob_name, me)
+        bpy.context.scene.collection.objects.link(ob)
+        bpy.context.view_layer.objects.active = ob
+        time_start = time.time()
+        if bulk:
+            self.fillBulk(me)
+        else:
+            self.fillBMesh(me)
+        log.debug(f"Filled mesh {me_name} ({'bulk' if bulk else 'bmesh'}) in {time.time() - time_start:.4f} sec")
+
         me.calc_normals()
         me.validate()
         me.update()
@@ -525,6 +749,18 @@ class Mesh:
                 grp = ob.vertex_groups.new(name=name)
                 for v in vgroup:
                     grp.add([v], 1.0, "REPLACE")
+        self.setupObject(ob, hierarchy)
+
+        if instances is not None:
+            instances[instanceKey] = me
+
+    def setupObject(self, ob, hierarchy):
+        if hierarchy:
+            # vertex weights are stored in the mesh data, but vertex group names are per object.
+            # this creates the groups missing from a linked duplicate, in the same order so indices match
+            for name in self.vgroups:
+                if name not in ob.vertex_groups:
+                    ob.vertex_groups.new(name=name)
             ob.parent = hierarchy.armature
             mod = ob.modifiers.new(hierarchy.name, "ARMATURE")
             mod.object = hierarchy.armature
@@ -535,7 +771,13 @@ class Mesh:
 
 
 class Limb:
+    __slots__ = (
+        "index", "parent", "child", "sibling", "pos", "near", "far",
+        "poseBone", "poseLocPath", "poseRotPath", "poseLoc", "poseRot",
+    )
+
     def __init__(self):
+        self.index = 0
         self.parent, self.child, self.sibling = -1, -1, -1
         self.pos = Vector([0, 0, 0])
         self.near, self.far = 0x00000000, 0x00000000
@@ -644,15 +886,119 @@ class Hierarchy:
         return self.limb[0]
 
 
+# https://wiki.cloudmodding.com/oot/F3DZEX#RSP_Geometry_Mode
+geometryModeMasks = {
+    "G_ZBUFFER":            0b00000000000000000000000000000001,
+    "G_SHADE":              0b00000000000000000000000000000100, # used by 0x05/0x06 for mesh.faces_use_smooth
+    "G_CULL_FRONT":         0b00000000000000000000001000000000, # TODO: set culling (not possible per-face or per-material or even per-object apparently) / SharpOcarina tags
+    "G_CULL_BACK":          0b00000000000000000000010000000000, # TODO: same
+    "G_FOG":                0b00000000000000010000000000000000,
+    "G_LIGHTING":           0b00000000000000100000000000000000,
+    "G_TEXTURE_GEN":        0b00000000000001000000000000000000, # TODO: billboarding?
+    "G_TEXTURE_GEN_LINEAR": 0b00000000000010000000000000000000, # TODO: billboarding?
+    "G_SHADING_SMOOTH":     0b00000000001000000000000000000000, # used by 0x05/0x06 for mesh.faces_use_smooth
+    "G_CLIPPING":           0b00000000100000000000000000000000,
+}
+
+class RSPState:
+    """
+    RSP/RDP state set by display list commands, it carries over from one display list to the next
+    """
+    __slots__ = (
+        "vbuf", "tile", "curTile", "geometryModeFlags", "palSize",
+        "primColor", "envColor", "vertexColor", "shadeColor",
+    )
+
+    def __init__(self):
+        self.vbuf = VertexBuffer()
+        self.tile = [Tile(), Tile()]
+        self.curTile = self.tile[0]
+        self.geometryModeFlags = set()
+        self.palSize = 0
+        self.resetCombiner()
+
+    def resetCombiner(self):
+        self.primColor = Vector([1.0, 1.0, 1.0, 1.0])
+        self.envColor = Vector([1.0, 1.0, 1.0, 1.0])
+        self.vertexColor = Vector([1.0, 1.0, 1.0, 1.0])
+        self.shadeColor = Vector([1.0, 1.0, 1.0])
+
+    def copy(self):
+        rsp = RSPState.__new__(RSPState)
+        rsp.vbuf = self.vbuf.copy()
+        rsp.tile = [tile.copy() for tile in self.tile]
+        rsp.curTile = rsp.tile[self.tile.index(self.curTile)]
+        rsp.geometryModeFlags = self.geometryModeFlags.copy()
+        rsp.palSize = self.palSize
+        # colors are replaced, never modified in place
+        rsp.primColor, rsp.envColor = self.primColor, self.envColor
+        rsp.vertexColor, rsp.shadeColor = self.vertexColor, self.shadeColor
+        return rsp
+
+    def getKey(self):
+        """
+        Hashable value identifying everything in this state that can change how a display list is read
+        """
+        vbuf = self.vbuf
+        return (
+            vbuf.pos.tobytes(), vbuf.uv.tobytes(), vbuf.normal.tobytes(), vbuf.color.tobytes(), tuple(vbuf.limb),
+            tuple(
+                tuple(tuple(value) if isinstance(value, list) else value for value in (getattr(tile, name) for name in Tile.stateFields))
+                for tile in self.tile
+            ),
+            self.tile.index(self.curTile),
+            frozenset(self.geometryModeFlags),
+            self.palSize,
+            # vertexColor and shadeColor are set for each vertex before being used
+            tuple(self.primColor), tuple(self.envColor),
+        )
+
+class DisplayListContext:
+    """
+    State local to reading one display list with F3DZEX.buildDisplayList
+    """
+    __slots__ = (
+        "log", "hierarchy", "limb", "offset", "segment", "data",
+        "mesh_name_format", "skipAlreadyRead", "extraLenient",
+        "mesh", "has_tex", "material", "matrix",
+    )
+
+    def __init__(self, log, hierarchy, limb, offset, data, mesh_name_format, skipAlreadyRead, extraLenient):
+        self.log = log
+        self.hierarchy, self.limb = hierarchy, limb
+        self.offset = offset
+        self.segment = offset >> 24
+        self.data = data
+        self.mesh_name_format = mesh_name_format
+        self.skipAlreadyRead = skipAlreadyRead
+        self.extraLenient = extraLenient
+        self.mesh = Mesh()
+        self.has_tex = False
+        self.material = None
+        self.matrix = [limb] if hierarchy else [None]
+
+class DisplayListResult:
+    """
+    What reading a display list (including the ones it calls) did, so it can be replayed instead of read again
+    """
+    __slots__ = ("meshes", "readRanges", "rsp")
+
+    def __init__(self):
+        self.meshes = [] # (Mesh, arguments to Mesh.create)
+        self.readRanges = [] # (segment, (from, to)) added to F3DZEX.alreadyRead
+        self.rsp = None # RSPState after reading
+
+
 class F3DZEX:
-    def __init__(self, detected_display_lists_use_transparency, config, prefix=""):
+    def __init__(self, detected_display_lists_use_transparency, config, prefix="", segmentPool=None):
         self.prefix = prefix
         self.config = config
 
         self.use_transparency = detected_display_lists_use_transparency
         self.alreadyRead = []
-        self.segment, self.vbuf, self.tile = [], [], []
-        self.geometryModeFlags = set()
+        self.segment = []
+        self.rsp = RSPState()
+        self.opcodeHandlers = self.makeOpcodeHandlers()
 
         self.animTotal = 0
         self.TimeLine = 0
@@ -660,20 +1006,33 @@ class F3DZEX:
         self.displaylists = []
 
         for _ in range(16):
-            self.alreadyRead.append([])
+            self.alreadyRead.append(IntervalSet())
             self.segment.append([])
-            self.vbuf.append(Vertex())
-        for _ in range(2):
-            self.tile.append(Tile())
-            pass#self.vbuf.append(Vertex())
-        for _ in range(14 + 32):
-            pass#self.vbuf.append(Vertex())
-        while len(self.vbuf) < 32:
-            self.vbuf.append(Vertex())
-        self.curTile = self.tile[0]
-        self.material = []
+        self.material = {} # getMaterialKey() -> material
+        self.materialHits, self.materialMisses = 0, 0
+        # display list call graph, see scanCallGraph
+        self.displayListCalls = {} # address -> addresses of display lists it calls
+        self.displayListReferences = {} # address -> number of commands calling it
+        # (address, input state) -> DisplayListResult, for display lists called from several places
+        self.displayListMemo = {}
+        self.displayListMemoHits, self.displayListMemoMisses = 0, 0
+        self.recordings = [] # DisplayListResult being recorded, innermost last
+        self.meshInstances = {} # see Mesh.create
+        self.segmentPaths = {} # segment -> path of the file it was loaded from
+        self.segmentMaps = [] # mmap objects backing segments, see loadSegment
+        self.segmentPool = segmentPool
+        self.sharedSegments = {} # segment -> path, for segments from segmentPool
+        self.segmentIndex = {} # segment -> see getSegmentIndex
+        self.segmentDigests = {} # segment -> see getSegmentDigest
+        self.images = {}
         self.hierarchy = []
-        self.resetCombiner()
+
+        self.textureCache = None
+        if config["enable_texture_cache"]:
+            self.textureCache = TextureCache(
+                bpy.utils.user_resource("DATAFILES", path="zelda64_import_texture_cache", create=True),
+                config["texture_cache_size"] << 20
+            )
 
     def loaddisplaylists(self, path):
         log = getLogger("F3DZEX.loaddisplaylists")
@@ -689,87 +1048,261 @@ class F3DZEX:
             log.exception("Could not read displaylists.txt")
 
     def loadSegment(self, seg, path):
+        """
+        Segment data is memory-mapped and exposed as a read-only memoryview, call releaseSegments once done importing.
+        Segments other than 0x03 and 0x06 (the imported file) come from the segment pool, if any
+        """
         try:
-            with open(path, "rb") as file:
-                self.segment[seg] = file.read()
+            self.releaseSegment(seg)
+            if self.segmentPool is not None and seg not in (0x03, 0x06):
+                data = self.segmentPool.acquire(path)
+                self.sharedSegments[seg] = path
+            else:
+                mapped, data = mapFile(path)
+                if mapped:
+                    self.segmentMaps.append(mapped)
+            self.segment[seg] = data
+            self.segmentPaths[seg] = path
         except:
             getLogger("F3DZEX.loadSegment").error(f"Could not load segment 0x{seg:02X} data from {path}")
             pass
 
+    def releaseSegment(self, seg):
+        self.segmentIndex.pop(seg, None)
+        self.segmentDigests.pop(seg, None)
+        self.segmentPaths.pop(seg, None)
+        if seg in self.sharedSegments:
+            self.segmentPool.release(self.sharedSegments.pop(seg))
+        elif isinstance(self.segment[seg], memoryview):
+            try:
+                self.segment[seg].release()
+            except BufferError:
+                getLogger("F3DZEX.releaseSegment").debug(f"Segment 0x{seg:02X} data is still in use")
+        self.segment[seg] = []
+
+    def releaseSegments(self):
+        """
+        Unmap the files segments were loaded from, segment data can't be used afterwards
+        """
+        log = getLogger("F3DZEX.releaseSegments")
+        for seg in range(len(self.segment)):
+            self.releaseSegment(seg)
+        for mapped in self.segmentMaps:
+            try:
+                mapped.close()
+            except BufferError:
+                # still referenced, it will be unmapped once garbage collected
+                log.debug("A segment file mapping is still in use")
+        self.segmentMaps = []
+
+    # increment when indexSegment results change
+    segmentIndexVersion = 1
+
+    def getSegmentDigest(self, segment):
+        """sha1 hex digest of the segment data, computed once per file (by the segment pool for shared segments)"""
+        digest = self.segmentDigests.get(segment)
+        if digest is None:
+            sharedPath = self.sharedSegments.get(segment)
+            if sharedPath:
+                digest = self.segmentPool.getDigest(sharedPath)
+            else:
+                digest = hashlib.sha1(self.segment[segment]).hexdigest()
+            self.segmentDigests[segment] = digest
+        return digest
+
+    def getSegmentIndex(self, segment):
+        """
+        Returns what indexSegment finds in the segment. If the segment was loaded from a file and cache_scan_results is set,
+        the index is saved in the user's scan results cache directory, named after the digest of the file contents,
+        and read from there on later imports of the same file contents (wherever the file is).
+        """
+        log = getLogger("F3DZEX.getSegmentIndex")
+        if segment in self.segmentIndex:
+            return self.segmentIndex[segment]
+        data = self.segment[segment]
+        path = self.segmentPaths.get(segment)
+        sharedPath = self.sharedSegments.get(segment)
+        if sharedPath:
+            index = self.segmentPool.getIndex(sharedPath)
+            if index is not None:
+                self.segmentIndex[segment] = index
+                return index
+        index = None
+        cachePath = None
+        if path and self.config["cache_scan_results"]:
+            digest = self.getSegmentDigest(segment)
+            cachePath = os.path.join(
+                bpy.utils.user_resource("DATAFILES", path="zelda64_import_scan_cache", create=True),
+                f"{digest}.json"
+            )
+            if os.path.isfile(cachePath):
+                try:
+                    with open(cachePath, "r") as file:
+                        saved = json.load(file)
+                    if saved.get("version") == self.segmentIndexVersion and saved.get("sha1") == digest:
+                        index = saved["index"]
+                        log.info(f"Using cached scan results for {path}")
+                    else:
+                        log.info(f"Ignoring outdated cached scan results for {path}")
+                except (OSError, ValueError, KeyError):
+                    log.exception(f"Could not read scan results from {cachePath}")
+        if index is None:
+            time_start = time.time()
+            index = self.indexSegment(data)
+            log.debug(f"Indexed segment 0x{segment:02X} in {time.time() - time_start:.4f} sec")
+            if cachePath:
+                try:
+                    with open(cachePath, "w") as file:
+                        json.dump({"version": self.segmentIndexVersion, "sha1": digest, "index": index}, file)
+                except OSError:
+                    log.warning(f"Could not save scan results to {cachePath}")
+        self.segmentIndex[segment] = index
+        if sharedPath:
+            self.segmentPool.setIndex(sharedPath, index)
+        return index
+
+    def indexSegment(self, data):
+        """
+        Scan data once for everything importing may look for:
+        hierarchies, animations, display list candidates (searchAndImport) and map header commands.
+        All values are plain lists so the result can be saved as json
+        """
+        size = len(data)
+        words = np.frombuffer(data, dtype=">u4", count=size // 4).astype(np.int64)
+        commands = np.frombuffer(data, dtype=np.uint8)
+        if size % 8:
+            commands = np.concatenate((commands, np.zeros(-size % 8, dtype=np.uint8)))
+        commands = commands.reshape(-1, 8)
+        displayLists, _ = self.findDisplayListCandidates(commands, False)
+        displayListsImplemented, unimplementedOpcodes = self.findDisplayListCandidates(commands, True)
+        # map header commands are read until 0x14 (end marker)
+        opcodes = commands[:, 0]
+        mapHeadersEnds = np.flatnonzero(opcodes == 0x14)
+        mapHeadersEnd = mapHeadersEnds[0] if len(mapHeadersEnds) else len(opcodes)
+        mapHeaders = np.flatnonzero(opcodes[:mapHeadersEnd] == 0x0A) * 8
+        return {
+            "hierarchies": self.findHierarchyCandidates(data, words),
+            "animations": self.findAnimationCandidates(data, words),
+            "displayLists": displayLists,
+            "displayListsImplemented": displayListsImplemented,
+            "unimplementedOpcodes": unimplementedOpcodes,
+            "mapHeaders": mapHeaders.tolist(),
+            "mapHeadersEnd": bool(len(mapHeadersEnds)),
+        }
+
     def locateHierarchies(self):
         log = getLogger("F3DZEX.locateHierarchies")
-        data = self.segment[0x06]
-        for i in range(0, len(data)-11, 4):
-            # test for header "bboooooo pp000000 xx000000": if segment bb=0x06 and offset oooooo 4-aligned and not zero parts (pp!=0)
-            if data[i] == 0x06 and (data[i+3] & 3) == 0 and data[i+4] != 0:
-                offset = unpack_from(">L", data, i)[0] & 0x00FFFFFF
-                if offset < len(data):
-                    # each Limb index entry is 4 bytes starting at offset
-                    offset_end = offset + (data[i+4] << 2)
-                    if offset_end <= len(data):
-                        j = offset
-                        while j < offset_end:
-                            # test for limb entry "bboooooo": valid limb entry table as long as segment bb=0x06 and offset oooooo 4-aligned and offset is valid
-                            if data[j] != 0x06 or (data[j+3] & 3) != 0 or (unpack_from(">L", data, j)[0] & 0x00FFFFFF) > len(data):
-                                break
-                            j += 4
-                        if (j == i):
-                            j |= 0x06000000
-                            log.info(f"    hierarchy found at 0x{j:08X}")
-                            h = Hierarchy()
-                            if h.read(self.segment, j, self.config["scale_factor"], prefix=self.prefix):
-                                self.hierarchy.append(h)
-                            else:
-                                log.warning(f"Skipping hierarchy at 0x{j:08X}")
-
-    def locateAnimations(self):
+        for i in self.getSegmentIndex(0x06)["hierarchies"]:
+            j = 0x06000000 | i
+            log.info(f"    hierarchy found at 0x{j:08X}")
+            h = Hierarchy()
+            if h.read(self.segment, j, self.config["scale_factor"], prefix=self.prefix):
+                self.hierarchy.append(h)
+            else:
+                log.warning(f"Skipping hierarchy at 0x{j:08X}")
+
+    def findHierarchyCandidates(self, data, words):
+        """
+        Find hierarchy headers in data (segment 0x06, words as in indexSegment), returns their offsets.
+        A header "bboooooo pp000000 xx000000" must have segment bb=0x06, offset oooooo 4-aligned
+        and not zero parts (pp!=0), and its limb index table of pp entries must end right at the header.
+        Candidates whose limbs are out of range or link to limbs that don't exist are rejected.
+        """
+        log = getLogger("F3DZEX.findHierarchyCandidates")
+        size = len(data)
+        offsets = words & 0x00FFFFFF
+        # test for limb entry "bboooooo": valid limb entry table as long as segment bb=0x06 and offset oooooo 4-aligned and offset is valid
+        isLimbEntry = ((words >> 24) == 0x06) & ((words & 3) == 0) & (offsets <= size)
+        # headers are 12 bytes
+        headerCount = max(0, (size - 12) // 4 + 1)
+        indices = np.arange(headerCount)
+        limbCounts = words[1:headerCount + 1] >> 24
+        isHeader = (
+            isLimbEntry[:headerCount] & (limbCounts != 0)
+            & (offsets[:headerCount] < size)
+            # each Limb index entry is 4 bytes starting at offset
+            & (offsets[:headerCount] + (limbCounts << 2) == (indices << 2))
+        )
+        # invalidEntriesBefore[k] is the amount of invalid limb entries in words[:k]
+        invalidEntriesBefore = np.concatenate(([0], np.cumsum(~isLimbEntry)))
+        headers = np.flatnonzero(isHeader)
+        tableStarts = offsets[headers] >> 2
+        headers = headers[invalidEntriesBefore[headers] == invalidEntriesBefore[tableStarts]]
+
+        bytesSigned = np.frombuffer(data, dtype=np.int8)
+        candidates = []
+        for k in headers.tolist():
+            limbCount = int(limbCounts[k])
+            limbOffsets = offsets[k - limbCount:k]
+            # same check as in Hierarchy.read
+            if np.any(limbOffsets + 12 >= size):
+                log.debug(f"Rejecting hierarchy candidate at 0x{k << 2:X}: limbs out of range")
+                continue
+            linked = np.concatenate((bytesSigned[limbOffsets + 6], bytesSigned[limbOffsets + 7]))
+            if np.any((linked < -1) | (linked >= limbCount)):
+                log.debug(f"Rejecting hierarchy candidate at 0x{k << 2:X}: child or sibling index out of range")
+                continue
+            candidates.append(k << 2)
+        return candidates
+
+    def locateAnimations(self, segment=0x06):
+        """
+        Find animation headers in the given segment (0x06 for the object's own animations, 0x0F for external ones)
+        """
         log = getLogger("F3DZEX.locateAnimations")
-        data = self.segment[0x06]
         self.animation = []
         self.offsetAnims = []
         self.durationAnims = []
-        for i in range(0, len(data)-15, 4):
-            # detect animation header
-            # ffff0000 rrrrrrrr iiiiiiii llll0000
-            # FIXME: data[i] == 0 but should be first byte of ffff
-            # FIXME: data[i+1] > 1 but why not 1 (or 0)
-            if ((data[i] == 0) and (data[i+1] > 1) and
-                 (data[i+2] == 0) and (data[i+3] == 0) and
-                 (data[i+4] == 0x06) and
-                 (((data[i+5] << 16)|(data[i+6] << 8)|data[i+7]) < len(data)) and
-                 (data[i+8] == 0x06) and
-                 (((data[i+9] << 16)|(data[i+10] << 8)|data[i+11]) < len(data)) and
-                 (data[i+14] == 0) and (data[i+15] == 0)):
-                log.info(f"          Anims found at {i:08X} Frames: {data[i+1] & 0x00FFFFFF}")
-                self.animation.append(i)
-                self.offsetAnims.append(i)
-                self.offsetAnims[self.animTotal] = (0x06 << 24) | i
-                # FIXME: it's two bytes, not one
-                self.durationAnims.append(data[i+1] & 0x00FFFFFF)
-                self.animTotal += 1
+        for i, frameCount in self.getSegmentIndex(segment)["animations"]:
+            log.info(f"          Anims found at {i:08X} Frames: {frameCount}")
+            self.animation.append(i)
+            self.offsetAnims.append((segment << 24) | i)
+            self.durationAnims.append(frameCount)
+        self.animTotal = len(self.animation)
         if(self.animTotal > 0):
-                log.info(f"          Total Anims                         : {self.animTotal}")
-
-    def locateExternAnimations(self):
-        log = getLogger("F3DZEX.locateExternAnimations")
-        data = self.segment[0x0F]
-        self.animation = []
-        self.offsetAnims = []
-        for i in range(0, len(data)-15, 4):
-            if ((data[i] == 0) and (data[i+1] > 1) and
-                 (data[i+2] == 0) and (data[i+3] == 0) and
-                 (data[i+4] == 0x06) and
-                 (((data[i+5] << 16)|(data[i+6] << 8)|data[i+7]) < len(data)) and
-                 (data[i+8] == 0x06) and
-                 (((data[i+9] << 16)|(data[i+10] << 8)|data[i+11]) < len(data)) and
-                 (data[i+14] == 0) and (data[i+15] == 0)):
-                log.info(f"          Ext Anims found at {i:08X} Frames: {data[i+1] & 0x00FFFFFF}")
-                self.animation.append(i)
-                self.offsetAnims.append(i)
-                self.offsetAnims[self.animTotal] = (0x0F << 24) | i
-                self.animTotal += 1
-        if(self.animTotal > 0):
-            log.info(f"        Total Anims                   : {self.animTotal}")
+            log.info(f"          Total Anims                         : {self.animTotal}")
+
+    def findAnimationCandidates(self, data, words):
+        """
+        Find animation headers in data (words as in indexSegment), returns a list of (offset, frame count)
+        """
+        log = getLogger("F3DZEX.findAnimationCandidates")
+        size = len(data)
+        headerCount = max(0, (size - 16) // 4 + 1)
+        if headerCount == 0:
+            return []
+        # detect animation header
+        # ffff0000 rrrrrrrr iiiiiiii llll0000
+        w0 = words[0:headerCount]
+        w1 = words[1:headerCount + 1]
+        w2 = words[2:headerCount + 2]
+        w3 = words[3:headerCount + 3]
+        rotValues = w1 & 0x00FFFFFF
+        rotIndices = w2 & 0x00FFFFFF
+        # FIXME: first byte should be part of ffff (FIXME: second byte > 1 but why not 1 (or 0))
+        frameCounts = (w0 >> 16) & 0xFF
+        isHeader = (
+            ((w0 & 0xFF00FFFF) == 0) & (frameCounts > 1)
+            & ((w1 >> 24) == 0x06) & (rotValues < size)
+            & ((w2 >> 24) == 0x06) & (rotIndices < size)
+            & ((w3 & 0xFFFF) == 0)
+        )
+        headers = np.flatnonzero(isHeader)
+        # the tables must be in range: values and indices are s16, there are indices for at least the root translation,
+        # and there are at least llll (the amount of values that don't change with frames) values before the end of the values table
+        limits = w3[headers] >> 16
+        rotValues, rotIndices = rotValues[headers], rotIndices[headers]
+        rotValuesEnd = np.where(rotValues < rotIndices, rotIndices, size)
+        inRange = (
+            ((rotValues & 1) == 0) & ((rotIndices & 1) == 0)
+            & (rotIndices + 6 <= size)
+            & (limits <= (rotValuesEnd - rotValues) // 2)
+        )
+        if not np.all(inRange):
+            log.debug(f"Rejected animations with tables out of range at {', '.join(f'0x{k << 2:X}' for k in headers[~inRange].tolist())}")
+        headers = headers[inRange]
+        # FIXME: it's two bytes, not one
+        return list(zip((headers << 2).tolist(), frameCounts[headers].tolist()))
 
     def locateLinkAnimations(self, anim_to_play):
         log = getLogger("F3DZEX.locateLinkAnimations")
@@ -859,11 +1392,9 @@ class F3DZEX:
                 log.error(badJfifMessage)
             return False
         jfifData = None
-        i = jfifDataStart
-        for i in range(jfifDataStart, len(data)-1):
-            if data[i] == 0xFF and data[i+1] == 0xD9:
-                jfifData = data[jfifDataStart:i+2]
-                break
+        jfifEnd = re.compile(b"\xFF\xD9").search(data, jfifDataStart)
+        if jfifEnd:
+            jfifData = data[jfifDataStart:jfifEnd.end()]
         if jfifData is None:
             log.error(f"Did not find end marker 0xFFD9 in background image at 0x{jfifDataStart:X}")
             return False
@@ -916,111 +1447,110 @@ class F3DZEX:
     def importMapWithHeaders(self):
         log = getLogger("F3DZEX.importMapWithHeaders")
         data = self.segment[0x03]
-        for i in range(0, len(data), 8):
-            if data[i] == 0x0A:
-                mapHeaderSegment = data[i+4]
-                if mapHeaderSegment != 0x03:
-                    log.warning(f"Skipping map header located in segment 0x{mapHeaderSegment:02X}, referenced by command at 0x{i:X}")
+        index = self.getSegmentIndex(0x03)
+        for i in index["mapHeaders"]:
+            mapHeaderSegment = data[i+4]
+            if mapHeaderSegment != 0x03:
+                log.warning(f"Skipping map header located in segment 0x{mapHeaderSegment:02X}, referenced by command at 0x{i:X}")
+                continue
+            # mesh header offset 
+            mho = (data[i+5] << 16) | (data[i+6] << 8) | data[i+7]
+            if not mho < len(data):
+                log.error(f"Mesh header offset 0x{mho:X} is past the room file size, skipping")
+                continue
+            type = data[mho]
+            log.info(f"            Mesh Type: {type}")
+            if type == 0:
+                if mho + 12 > len(data):
+                    log.error(f"Mesh header at 0x{mho:X} of type {type} extends past the room file size, skipping")
                     continue
-                # mesh header offset 
-                mho = (data[i+5] << 16) | (data[i+6] << 8) | data[i+7]
-                if not mho < len(data):
-                    log.error(f"Mesh header offset 0x{mho:X} is past the room file size, skipping")
+                count = data[mho+1]
+                startSeg = data[mho+4]
+                start = (data[mho+5] << 16) | (data[mho+6] << 8) | data[mho+7]
+                endSeg = data[mho+8]
+                end = (data[mho+9] << 16) | (data[mho+10] << 8) | data[mho+11]
+                if startSeg != endSeg:
+                    log.error(f"Mesh header at 0x{mho:X} of type {type} has start and end in different segments 0x{startSeg:02X} and 0x{endSeg:02X}, skipping")
                     continue
-                type = data[mho]
-                log.info(f"            Mesh Type: {type}")
-                if type == 0:
-                    if mho + 12 > len(data):
-                        log.error(f"Mesh header at 0x{mho:X} of type {type} extends past the room file size, skipping")
-                        continue
-                    count = data[mho+1]
-                    startSeg = data[mho+4]
-                    start = (data[mho+5] << 16) | (data[mho+6] << 8) | data[mho+7]
-                    endSeg = data[mho+8]
-                    end = (data[mho+9] << 16) | (data[mho+10] << 8) | data[mho+11]
-                    if startSeg != endSeg:
-                        log.error(f"Mesh header at 0x{mho:X} of type {type} has start and end in different segments 0x{startSeg:02X} and 0x{endSeg:02X}, skipping")
-                        continue
-                    if startSeg != 0x03:
-                        log.error(f"Skipping mesh header at 0x{mho:X} of type {type}: entries are in segment 0x{startSeg:02X}")
-                        continue
-                    log.info(f"Reading {count} display lists from 0x{start:X} to 0x{end:X}")
-                    for j in range(start, end, 8):
-                        opa, xlu = unpack_from(">LL", data, j)
-                        if opa:
-                            self.use_transparency = False
-                            self.buildDisplayList(None, [None], opa, mesh_name_format="%s_opa")
-                        if xlu:
-                            self.use_transparency = True
-                            self.buildDisplayList(None, [None], xlu, mesh_name_format="%s_xlu")
-                elif type == 1:
-                    format = data[mho+1]
-                    entrySeg = data[mho+4]
-                    entry = (data[mho+5] << 16) | (data[mho+6] << 8) | data[mho+7]
-                    if entrySeg == 0x03:
-                        opa, xlu = unpack_from(">LL", data, entry)
-                        if opa:
-                            self.use_transparency = False
-                            self.buildDisplayList(None, [None], opa, mesh_name_format="%s_opa")
-                        if xlu:
-                            self.use_transparency = True
-                            self.buildDisplayList(None, [None], xlu, mesh_name_format="%s_xlu")
-                    else:
-                        log.error(f"Skipping mesh header at 0x{mho:X} of type {type}: entry is in segment 0x{entrySeg:02X}")
-                    if format == 1:
-                        if not self.importJFIF(data, mho + 8):
-                            log.error(f"Failed to import jfif background image, mesh header at 0x{mho:X} of type 1 format 1")
-                    elif format == 2:
-                        background_count = data[mho + 8]
-                        backgrounds_array = unpack_from(">L", data, mho + 0xC)[0]
-                        if backgrounds_array >> 24 == 0x03:
-                            backgrounds_array &= 0xFFFFFF
-                            for i in range(background_count):
-                                bg_record_offset = backgrounds_array + i * 0x1C
-                                unk82, bgid = struct.unpack_from(">HB", data, bg_record_offset)
-                                if unk82 != 0x0082:
-                                    log.error(f"Skipping JFIF: mesh header at 0x{mho:X} type 1 format 2 background record entry #{i} at 0x{bg_record_offset:X} expected unk82=0x0082, not 0x{unk82:04X}")
-                                    continue
-                                ob = self.importJFIF(
-                                    data, bg_record_offset + 4,
-                                    name_format=f"bg_{i}_%08X"
-                                )
-                                ob.location.y -= self.config["scale_factor"] * 100 * i
-                                if not ob:
-                                    log.error(f"Failed to import jfif background image from record entry #{i} at 0x{bg_record_offset:X}, mesh header at 0x{mho:X} of type 1 format 2")
-                        else:
-                            log.error(f"Skipping mesh header at 0x{mho:X} of type 1 format 2: backgrounds_array=0x{backgrounds_array:08X} is not in segment 0x03")
+                if startSeg != 0x03:
+                    log.error(f"Skipping mesh header at 0x{mho:X} of type {type}: entries are in segment 0x{startSeg:02X}")
+                    continue
+                log.info(f"Reading {count} display lists from 0x{start:X} to 0x{end:X}")
+                for j in range(start, end, 8):
+                    opa, xlu = unpack_from(">LL", data, j)
+                    if opa:
+                        self.use_transparency = False
+                        self.buildDisplayList(None, [None], opa, mesh_name_format="%s_opa")
+                    if xlu:
+                        self.use_transparency = True
+                        self.buildDisplayList(None, [None], xlu, mesh_name_format="%s_xlu")
+            elif type == 1:
+                format = data[mho+1]
+                entrySeg = data[mho+4]
+                entry = (data[mho+5] << 16) | (data[mho+6] << 8) | data[mho+7]
+                if entrySeg == 0x03:
+                    opa, xlu = unpack_from(">LL", data, entry)
+                    if opa:
+                        self.use_transparency = False
+                        self.buildDisplayList(None, [None], opa, mesh_name_format="%s_opa")
+                    if xlu:
+                        self.use_transparency = True
+                        self.buildDisplayList(None, [None], xlu, mesh_name_format="%s_xlu")
+                else:
+                    log.error(f"Skipping mesh header at 0x{mho:X} of type {type}: entry is in segment 0x{entrySeg:02X}")
+                if format == 1:
+                    if not self.importJFIF(data, mho + 8):
+                        log.error(f"Failed to import jfif background image, mesh header at 0x{mho:X} of type 1 format 1")
+                elif format == 2:
+                    background_count = data[mho + 8]
+                    backgrounds_array = unpack_from(">L", data, mho + 0xC)[0]
+                    if backgrounds_array >> 24 == 0x03:
+                        backgrounds_array &= 0xFFFFFF
+                        for i in range(background_count):
+                            bg_record_offset = backgrounds_array + i * 0x1C
+                            unk82, bgid = struct.unpack_from(">HB", data, bg_record_offset)
+                            if unk82 != 0x0082:
+                                log.error(f"Skipping JFIF: mesh header at 0x{mho:X} type 1 format 2 background record entry #{i} at 0x{bg_record_offset:X} expected unk82=0x0082, not 0x{unk82:04X}")
+                                continue
+                            ob = self.importJFIF(
+                                data, bg_record_offset + 4,
+                                name_format=f"bg_{i}_%08X"
+                            )
+                            ob.location.y -= self.config["scale_factor"] * 100 * i
+                            if not ob:
+                                log.error(f"Failed to import jfif background image from record entry #{i} at 0x{bg_record_offset:X}, mesh header at 0x{mho:X} of type 1 format 2")
                     else:
-                        log.error(f"Unknown format {format} for mesh type 1 in mesh header at 0x{mho:X}")
-                elif type == 2:
-                    if mho + 12 > len(data):
-                        log.error(f"Mesh header at 0x{mho:X} of type {type} extends past the room file size, skipping")
-                        continue
-                    count = data[mho+1]
-                    startSeg = data[mho+4]
-                    start = (data[mho+5] << 16) | (data[mho+6] << 8) | data[mho+7]
-                    endSeg = data[mho+8]
-                    end = (data[mho+9] << 16) | (data[mho+10] << 8) | data[mho+11]
-                    if startSeg != endSeg:
-                        log.error(f"Mesh header at 0x{mho:X} of type {type} has start and end in different segments 0x{startSeg:02X} and 0x{endSeg:02X}, skipping")
-                        continue
-                    if startSeg != 0x03:
-                        log.error(f"Skipping mesh header at 0x{mho:X} of type {type}: entries are in segment 0x{startSeg:02X}")
-                        continue
-                    log.info(f"Reading {count} display lists from 0x{start:X} to 0x{end:X}")
-                    for j in range(start, end, 16):
-                        opa, xlu = unpack_from(">LL", data, j+8)
-                        if opa:
-                            self.use_transparency = False
-                            self.buildDisplayList(None, [None], opa, mesh_name_format="%s_opa")
-                        if xlu:
-                            self.use_transparency = True
-                            self.buildDisplayList(None, [None], xlu, mesh_name_format="%s_xlu")
+                        log.error(f"Skipping mesh header at 0x{mho:X} of type 1 format 2: backgrounds_array=0x{backgrounds_array:08X} is not in segment 0x03")
                 else:
-                    log.error(f"Unknown mesh type {type} in mesh header at 0x{mho:X}")
-            elif (data[i] == 0x14):
-                return
-        log.warning("Map headers ended unexpectedly")
+                    log.error(f"Unknown format {format} for mesh type 1 in mesh header at 0x{mho:X}")
+            elif type == 2:
+                if mho + 12 > len(data):
+                    log.error(f"Mesh header at 0x{mho:X} of type {type} extends past the room file size, skipping")
+                    continue
+                count = data[mho+1]
+                startSeg = data[mho+4]
+                start = (data[mho+5] << 16) | (data[mho+6] << 8) | data[mho+7]
+                endSeg = data[mho+8]
+                end = (data[mho+9] << 16) | (data[mho+10] << 8) | data[mho+11]
+                if startSeg != endSeg:
+                    log.error(f"Mesh header at 0x{mho:X} of type {type} has start and end in different segments 0x{startSeg:02X} and 0x{endSeg:02X}, skipping")
+                    continue
+                if startSeg != 0x03:
+                    log.error(f"Skipping mesh header at 0x{mho:X} of type {type}: entries are in segment 0x{startSeg:02X}")
+                    continue
+                log.info(f"Reading {count} display lists from 0x{start:X} to 0x{end:X}")
+                for j in range(start, end, 16):
+                    opa, xlu = unpack_from(">LL", data, j+8)
+                    if opa:
+                        self.use_transparency = False
+                        self.buildDisplayList(None, [None], opa, mesh_name_format="%s_opa")
+                    if xlu:
+                        self.use_transparency = True
+                        self.buildDisplayList(None, [None], xlu, mesh_name_format="%s_xlu")
+            else:
+                log.error(f"Unknown mesh type {type} in mesh header at 0x{mho:X}")
+        if not index["mapHeadersEnd"]:
+            log.warning("Map headers ended unexpectedly")
 
     def importObj(self):
         log = getLogger("F3DZEX.importObj")
@@ -1058,7 +1588,7 @@ class F3DZEX:
                 if limb.near != 0:
                     if validOffset(self.segment, limb.near):
                         log.info(f"    0x{i:02X} : building display lists...")
-                        self.resetCombiner()
+                        self.rsp.resetCombiner()
                         self.buildDisplayList(hierarchy, limb, limb.near)
                     else:
                         log.info(f"    0x{i:02X} : out of range")
@@ -1070,11 +1600,12 @@ class F3DZEX:
             bpy.ops.object.mode_set(mode="POSE", toggle=False)
             if (anim_to_play > 0):
                 bpy.context.scene.frame_end = 1
-                if(self.config["external_animes"] and len(self.segment[0x0F]) > 0):
-                    self.locateExternAnimations()
-                else:
-                    self.locateAnimations()
-                if len(self.animation) > 0:
+                animSegment = 0x0F if self.config["external_animes"] and len(self.segment[0x0F]) > 0 else 0x06
+                self.locateAnimations(animSegment)
+                if len(self.animation) > 0 and self.config["lazy_animations"]:
+                    log.info(f"Recording {len(self.animation)} animations, build them from the armature's Zelda64 Animations panel")
+                    self.recordAnimations(animSegment)
+                elif len(self.animation) > 0:
                     for h in self.hierarchy:
                         if h.armature.animation_data is None:
                             h.armature.animation_data_create()
@@ -1085,6 +1616,7 @@ class F3DZEX:
                     # this is useful for iron knuckles and anything with several hierarchies, although an unedited iron kunckles zobj won't work
                     hierarchy = max(self.hierarchy, key=lambda h:h.limbCount)
                     armature = hierarchy.armature
+                    decoded = self.decodeAnimations(animSegment, hierarchy.limbCount) if self.config["parallel_animations"] else None
                     log.info(f"Building animations using armature {armature.data.name} in {armature.name}")
                     for i in range(len(self.animation)):
                         anim_to_play = i + 1
@@ -1092,7 +1624,7 @@ class F3DZEX:
                         action = bpy.data.actions.new(f"{self.prefix}anim{anim_to_play}_{self.durationAnims[i]}")
                         action.use_fake_user = True
                         armature.animation_data.action = action
-                        self.buildAnimation(hierarchy, anim_to_play)
+                        self.buildAnimation(hierarchy, anim_to_play, decoded[i] if decoded else None)
                     for h in self.hierarchy:
                         h.armature.animation_data.action = action
                     bpy.context.scene.frame_end = max(self.durationAnims)
@@ -1117,387 +1649,539 @@ class F3DZEX:
         self.use_transparency = self.config["detected_display_lists_use_transparency"]
         log.info(f"Searching for {'non-read' if skipAlreadyRead else 'any'} display lists in segment 0x{segment:02X} (materials with transparency: {'yes' if self.use_transparency else 'no'}")
         log.warning(f"If the imported geometry is weird/wrong, consider using displaylists.txt to manually define the display lists to import!")
-        validOpcodesStartIndex = 0
-        validOpcodesSkipped = set()
-        for i in range(0, len(data), 8):
-            opcode = data[i]
-            # valid commands are 0x00-0x07 and 0xD3-0xFF
-            # however, could be not considered valid:
-            # 0x07 G_QUAD
-            # 0xEC G_SETCONVERT (YUV-related)
-            # 0xE4 G_TEXRECT, 0xF6 G_FILLRECT (2d overlay)
-            # 0xEB, 0xEE, 0xEF, 0xF1 ("unimplemented -> rarely used" being the reasoning)
-            # but filtering out those hurts the resulting import
-            isValid = (opcode <= 0x07 or opcode >= 0xD3) #and opcode not in (0x07,0xEC,0xE4,0xF6,0xEB,0xEE,0xEF,0xF1)
-            if isValid and self.config["detected_display_lists_consider_unimplemented_invalid"]:
-                
-                isValid = opcode not in (0x07,0xE5,0xEC,0xD3,0xDB,0xDC,0xDD,0xE0,0xE5,0xE9,0xF6,0xF8)
-                if not isValid:
-                    validOpcodesSkipped.add(opcode)
-            if not isValid:
-                validOpcodesStartIndex = None
-            elif validOpcodesStartIndex is None:
-                validOpcodesStartIndex = i
-            # if this command means "end of dlist"
-            if (opcode == 0xDE and data[i+1] != 0) or opcode == 0xDF:
-                # build starting at earliest valid opcode
-                log.debug(f"Found opcode 0x{opcode:X} at 0x{i:X}, building display list from 0x{validOpcodesStartIndex:X}")
-                self.buildDisplayList(
-                    None, [None], (segment << 24) | validOpcodesStartIndex,
-                    mesh_name_format = "%s_detect",
-                    skipAlreadyRead = skipAlreadyRead,
-                    extraLenient = True
-                )
-                validOpcodesStartIndex = None
-        if validOpcodesSkipped:
-            log.info(f"Valid opcodes {','.join(f'0x{opcode:02X}' for opcode in sorted(validOpcodesSkipped))} considered invalid because unimplemented (meaning rare)")
-
-    def resetCombiner(self):
-        self.primColor = Vector([1.0, 1.0, 1.0, 1.0])
-        self.envColor = Vector([1.0, 1.0, 1.0, 1.0])
-        self.vertexColor = Vector([1.0, 1.0, 1.0, 1.0])
-        self.shadeColor = Vector([1.0, 1.0, 1.0])
+        index = self.getSegmentIndex(segment)
+        if self.config["detected_display_lists_consider_unimplemented_invalid"]:
+            candidates = index["displayListsImplemented"]
+            if index["unimplementedOpcodes"]:
+                log.info(f"Valid opcodes {','.join(f'0x{opcode:02X}' for opcode in index['unimplementedOpcodes'])} considered invalid because unimplemented (meaning rare)")
+        else:
+            candidates = index["displayLists"]
+        for i, validOpcodesStartIndex in candidates:
+            log.debug(f"Found opcode 0x{data[i]:X} at 0x{i:X}, building display list from 0x{validOpcodesStartIndex:X}")
+            self.buildDisplayList(
+                None, [None], (segment << 24) | validOpcodesStartIndex,
+                mesh_name_format = "%s_detect",
+                skipAlreadyRead = skipAlreadyRead,
+                extraLenient = True
+            )
+
+    def findDisplayListCandidates(self, commands, considerUnimplementedInvalid):
+        """
+        Find commands ending a display list (0xDE G_DL without return, 0xDF G_ENDDL) in commands (see indexSegment),
+        returns a list of (offset of the ending command, offset of the earliest command in the run
+        of valid commands leading to it) for each, all offsets are multiples of 8,
+        and the valid opcodes that were considered invalid because of considerUnimplementedInvalid
+        """
+        opcodes = commands[:, 0]
+        validOpcodesSkipped = []
+        if len(opcodes) == 0:
+            return [], validOpcodesSkipped
+        # valid commands are 0x00-0x07 and 0xD3-0xFF
+        # however, could be not considered valid:
+        # 0x07 G_QUAD
+        # 0xEC G_SETCONVERT (YUV-related)
+        # 0xE4 G_TEXRECT, 0xF6 G_FILLRECT (2d overlay)
+        # 0xEB, 0xEE, 0xEF, 0xF1 ("unimplemented -> rarely used" being the reasoning)
+        # but filtering out those hurts the resulting import
+        isValid = (opcodes <= 0x07) | (opcodes >= 0xD3) #and opcode not in (0x07,0xEC,0xE4,0xF6,0xEB,0xEE,0xEF,0xF1)
+        if considerUnimplementedInvalid:
+            isUnimplemented = np.isin(opcodes, (0x07,0xE5,0xEC,0xD3,0xDB,0xDC,0xDD,0xE0,0xE5,0xE9,0xF6,0xF8))
+            validOpcodesSkipped = np.unique(opcodes[isValid & isUnimplemented]).tolist()
+            isValid &= ~isUnimplemented
+        # if this command means "end of dlist"
+        isEnd = ((opcodes == 0xDE) & (commands[:, 1] != 0)) | (opcodes == 0xDF)
+        # a run of valid commands starts after an invalid command or the end of a dlist
+        indices = np.arange(len(opcodes))
+        runStarts = np.where(np.concatenate(([True], ~isValid[:-1] | isEnd[:-1])), indices, 0)
+        runStarts = np.maximum.accumulate(runStarts)
+        ends = np.flatnonzero(isEnd)
+        # build starting at earliest valid opcode
+        return list(zip((ends * 8).tolist(), (runStarts[ends] * 8).tolist())), validOpcodesSkipped
+
+    def getMaterialKey(self, tile):
+        """
+        Everything the material created by tile.create depends on, other than import options which are the same for the whole import
+        """
+        return (
+            tile.data,
+            tile.palette if tile.texFmt == 2 else None,
+            tile.texFmt, tile.texSiz,
+            tuple(tile.r_dims),
+            tuple(tile.wrap), tuple(tile.mirror),
+            self.use_transparency,
+        )
 
     def checkUseNormals(self):
-        return self.config["vertex_mode"] == "NORMALS" or (self.config["vertex_mode"] == "AUTO" and "G_LIGHTING" in self.geometryModeFlags)
+        return self.config["vertex_mode"] == "NORMALS" or (self.config["vertex_mode"] == "AUTO" and "G_LIGHTING" in self.rsp.geometryModeFlags)
 
     def getCombinerColor(self):
         def multiply_color(v1, v2):
             return Vector(x * y for x, y in zip(v1, v2))
+        rsp = self.rsp
         cc = Vector([1.0, 1.0, 1.0, 1.0])
         # TODO: these have an effect even if vertexMode == "NONE" ?
         if self.config["enable_prim_color"]:
-            cc = multiply_color(cc, self.primColor)
+            cc = multiply_color(cc, rsp.primColor)
         if self.config["enable_env_color"]:
-            cc = multiply_color(cc, self.envColor)
+            cc = multiply_color(cc, rsp.envColor)
         # TODO: assume G_LIGHTING means normals if set, and colors if clear, but G_SHADE may play a role too?
-        if self.config["vertex_mode"] == "COLORS" or (self.config["vertex_mode"] == "AUTO" and "G_LIGHTING" not in self.geometryModeFlags):
-            cc = multiply_color(cc, self.vertexColor.to_4d())
+        if self.config["vertex_mode"] == "COLORS" or (self.config["vertex_mode"] == "AUTO" and "G_LIGHTING" not in rsp.geometryModeFlags):
+            cc = multiply_color(cc, rsp.vertexColor.to_4d())
         elif self.checkUseNormals():
-            cc = multiply_color(cc, self.shadeColor.to_4d())
+            cc = multiply_color(cc, rsp.shadeColor.to_4d())
         
         return cc
 
+    # opcode -> name of the method handling it in buildDisplayList, opcodes not listed are handled by opUnimplemented
+    opcodeHandlerNames = {
+        0x00: "opNoop", # G_NOOP
+        0x01: "opVertex", # G_VTX
+        0x02: "opModifyVertex", # G_MODIFYVTX
+        0x03: "opNoop", # G_CULLDL
+        0x04: "opNoop", # G_BRANCH_Z
+        0x05: "opTriangles", # G_TRI1
+        0x06: "opTriangles", # G_TRI2
+        0xD7: "opTexture", # G_TEXTURE
+        0xD8: "opPopMatrix", # G_POPMTX
+        0xD9: "opGeometryMode", # G_GEOMETRYMODE
+        0xDA: "opMatrix", # G_MTX
+        0xDE: "opDisplayList", # G_DL
+        0xDF: "opEndDisplayList", # G_ENDDL
+        0xE1: "opLODDisplayList", # "LOD dlists"
+        0xE2: "opNoop", # G_SETOTHERMODE_L
+        0xE3: "opNoop", # G_SETOTHERMODE_H
+        0xE4: "opLogOnly", # G_TEXRECT
+        0xE6: "opNoop", # G_RDPLOADSYNC
+        0xE7: "opNoop", # G_RDPPIPESYNC
+        0xE8: "opNoop", # G_RDPTILESYNC
+        0xF0: "opLoadTLUT", # G_LOADTLUT
+        0xF2: "opSetTileSize", # G_SETTILESIZE
+        0xF3: "opNoop", # G_LOADBLOCK
+        0xF4: "opLogOnly", # G_LOADTILE
+        0xF5: "opSetTile", # G_SETTILE
+        0xFA: "opSetPrimColor", # G_SETPRIMCOLOR
+        0xFB: "opSetEnvColor", # G_SETENVCOLOR
+        0xFC: "opNoop", # G_SETCOMBINE
+        0xFD: "opSetTextureImage", # G_SETTIMG
+        0xFE: "opLogOnly", # G_SETZIMG
+        0xFF: "opLogOnly", # G_SETCIMG
+    }
+
+    def makeOpcodeHandlers(self):
+        handlers = [self.opUnimplemented] * 256
+        for opcode, name in self.opcodeHandlerNames.items():
+            handlers[opcode] = getattr(self, name)
+        if not self.config["enable_matrices"]:
+            handlers[0xD8] = self.opUnimplemented
+            handlers[0xDA] = self.opUnimplemented
+        return handlers
+
     def buildDisplayList(self, hierarchy, limb, offset, mesh_name_format="%s", skipAlreadyRead=False, extraLenient=False):
         log = getLogger("F3DZEX.buildDisplayList")
         segment = offset >> 24
-        segmentMask = segment << 24
         data = self.segment[segment]
 
         startOffset = offset & 0x00FFFFFF
         endOffset = len(data)
         if skipAlreadyRead:
             log.trace(f"is 0x{startOffset:X} in {self.alreadyRead[segment]!r} ?")
-            for fromOffset,toOffset in self.alreadyRead[segment]:
-                if fromOffset <= startOffset and startOffset <= toOffset:
-                    log.debug(f"Skipping already read dlist at 0x{startOffset:X}")
-                    return
-                if startOffset <= fromOffset:
-                    if endOffset > fromOffset:
-                        endOffset = fromOffset
-                        log.debug(f"Shortening dlist to end at most at 0x{endOffset:X}, at which point it was read already")
+            alreadyRead = self.alreadyRead[segment]
+            if alreadyRead.covers(startOffset):
+                log.debug(f"Skipping already read dlist at 0x{startOffset:X}")
+                return
+            nextRead = alreadyRead.nextStart(startOffset)
+            if nextRead is not None and endOffset > nextRead:
+                endOffset = nextRead
+                log.debug(f"Shortening dlist to end at most at 0x{endOffset:X}, at which point it was read already")
             log.trace("no it is not")
 
-        def buildRec(offset):
-            self.buildDisplayList(hierarchy, limb, offset, mesh_name_format=mesh_name_format, skipAlreadyRead=skipAlreadyRead)
+        if not skipAlreadyRead and offset not in self.displayListCalls:
+            self.scanCallGraph(offset)
 
-        mesh = Mesh()
-        has_tex = False
-        material = None
-        if hierarchy:
-            matrix = [limb]
-        else:
-            matrix = [None]
+        ctx = DisplayListContext(log, hierarchy, limb, offset, data, mesh_name_format, skipAlreadyRead, extraLenient)
 
-        log.debug(f"Reading dlists from 0x{segmentMask | startOffset:08X}")
+        log.debug(f"Reading dlists from 0x{offset:08X}")
+        handlers = self.opcodeHandlers
         for i in range(startOffset, endOffset, 8):
-            w0, w1 = unpack_from(">LL", data, i)
-            # G_NOOP
-            if data[i] == 0x00:
-                pass
-            elif data[i] == 0x01:
-                count = (w0 >> 12) & 0xFF
-                index = ((w0 & 0xFF) >> 1) - count
-                vaddr = w1
-                if validOffset(self.segment, vaddr + int(16 * count) - 1):
-                    for j in range(count):
-                        self.vbuf[index + j].read(self.segment, vaddr + 16 * j, self.config["scale_factor"])
-                        if hierarchy:
-                            self.vbuf[index + j].limb = matrix[len(matrix) - 1]
-                            if self.vbuf[index + j].limb:
-                                self.vbuf[index + j].pos += self.vbuf[index + j].limb.pos
-            elif data[i] == 0x02:
-                try:
-                    index = ((data[i + 2] & 0x0F) << 3) | (data[i + 3] >> 1)
-                    if data[i + 1] == 0x10:
-                        # TODO: This pattern appears frequently. Make a function for it.
-                        self.vbuf[index].normal = Vector(unpack_from("bbb", data, i + 4)).xzy
-                        self.vbuf[index].normal.y = -self.vbuf[index].normal.y
-                        self.vbuf[index].normal /= 128
-                        # FIXME: BBBB pattern and [0]? This must be a mistake. Investigate further.
-                        self.vbuf[index].color = unpack_from("BBBB", data, i + 4)[0] / 255
-                    elif data[i + 1] == 0x14:
-                        self.vbuf[index].uv = Vector(unpack_from(">hh", data, i + 4))
-                except IndexError:
-                    if not extraLenient:
-                        log.exception(f"Bad vertex indices in 0x02 at 0x{i:X} {w0:08X} {w1:08X}")
-            elif data[i] == 0x05 or data[i] == 0x06:
-                if has_tex:
-                    material = None
-                    for j in range(len(self.material)):
-                        if self.material[j].name == f"mtl_{self.tile[0].data:08X}":
-                            material = self.material[j]
-                            break
-                    if material == None:
-                        material = self.tile[0].create(
-                            self.segment, 
-                            self.use_transparency,
-                            self.config["replicate_tex_mirror_blender"],
-                            self.config["enable_tex_mirror_sharp_ocarina_tags"],
-                            self.config["enable_tex_clamp_sharp_ocarina_tags"],
-                            self.config["enable_tex_clamp_blender"],
-                            self.config["fpath"],
-                            prefix=self.prefix
-                        )
-                        if material:
-                            self.material.append(material)
-                    has_tex = False
-                v1, v2 = None, None
-                vi1, vi2 = -1, -1
-                if not self.config["import_textures"]:
-                    material = None
-                nbefore_props = ["verts","uvs","colors","vgroups","faces","faces_use_smooth","normals"]
-                nbefore_lengths = [(nbefore_prop, len(getattr(mesh, nbefore_prop))) for nbefore_prop in nbefore_props]
-                # a1 a2 a3 are microcode values
-                def addTri(a1, a2, a3):
-                    try:
-                        verts = [self.vbuf[a >> 1] for a in (a1,a2,a3)]
-                    except IndexError:
-                        if extraLenient:
-                            return False
-                        raise
-                    verts_pos = [(v.pos.x, v.pos.y, v.pos.z) for v in verts]
-                    verts_index = [mesh.verts.index(pos) if pos in mesh.verts else None for pos in verts_pos]
-                    for j in range(3):
-                        if verts_index[j] is None:
-                            mesh.verts.append(verts_pos[j])
-                            verts_index[j] = len(mesh.verts) - 1
-                    mesh.uvs.append(material)
-                    face_normals = []
-                    for j in range(3):
-                        v = verts[j]
-                        vi = verts_index[j]
-                        # TODO: is this computation of shadeColor correct?
-                        sc = (((v.normal.x + v.normal.y + v.normal.z) / 3) + 1.0) / 2
-                        self.vertexColor = Vector([v.color[0], v.color[1], v.color[2], v.color[3]])
-                        self.shadeColor = Vector([sc, sc, sc])
-                        mesh.colors.append(self.getCombinerColor())
-                        mesh.uvs.append((self.tile[0].offset.x + v.uv.x * self.tile[0].ratio.x, self.tile[0].offset.y - v.uv.y * self.tile[0].ratio.y))
-                        if hierarchy:
-                            if v.limb:
-                                limb_name = f"limb_{v.limb.index:02}"
-                                if not (limb_name in mesh.vgroups):
-                                    mesh.vgroups[limb_name] = []
-                                mesh.vgroups[limb_name].append(vi)
-                        face_normals.append((vi, (v.normal.x, v.normal.y, v.normal.z)))
-                    mesh.faces.append(tuple(verts_index))
-                    mesh.faces_use_smooth.append("G_SHADE" in self.geometryModeFlags and "G_SHADING_SMOOTH" in self.geometryModeFlags)
-                    mesh.normals.append(tuple(face_normals))
-                    if len(set(verts_index)) < 3 and not extraLenient:
-                        log.warning(f"Found empty tri! {verts_index}")
-                    return True
+            # handlers return True when the display list ends
+            if handlers[data[i]](ctx, i):
+                return
+        log.warning(f"Reached end of dlist started at 0x{startOffset:X}")
+        self.endDisplayList(ctx, endOffset)
+
+    def endDisplayList(self, ctx, i):
+        self.createMesh(ctx.mesh, (ctx.mesh_name_format, ctx.hierarchy, ctx.offset, self.checkUseNormals()))
+        self.addAlreadyRead(ctx.segment, (ctx.offset & 0x00FFFFFF, i))
+
+    def createMesh(self, mesh, createArgs):
+        for recording in self.recordings:
+            recording.meshes.append((mesh, createArgs))
+        mesh.create(
+            *createArgs, prefix=self.prefix, bulk=self.config["bulk_mesh_creation"],
+            instances=self.meshInstances if self.config["link_duplicate_meshes"] else None
+        )
 
-                try:
-                    revert = not addTri(data[i+1], data[i+2], data[i+3])
-                    if data[i] == 0x06:
-                        revert = revert or not addTri(data[i+4+1], data[i+4+2], data[i+4+3])
-                except:
-                    log.exception(f"Failed to import vertices and/or their data from 0x{i:X}")
-                    revert = True
-                if revert:
-                    # revert any change
-                    for nbefore_prop, nbefore in nbefore_lengths:
-                        val_prop = getattr(mesh, nbefore_prop)
-                        while len(val_prop) > nbefore:
-                            val_prop.pop()
-            # G_TEXTURE
-            elif data[i] == 0xD7:
-                log.debug("0xD7 G_TEXTURE used, but unimplemented")
-                # FIXME: ?
-#                for tile in self.tile:
-#                    if ((w1 >> 16) & 0xFFFF) < 0xFFFF:
-#                        tile.scale.x = ((w1 >> 16) & 0xFFFF) * 0.0000152587891
-#                    else:
-#                        tile.scale.x = 1.0
-#                    if (w1 & 0xFFFF) < 0xFFFF:
-#                        tile.scale.y = (w1 & 0xFFFF) * 0.0000152587891
-#                    else:
-#                        tile.scale.y = 1.0
-                pass
-            # G_POPMTX
-            elif data[i] == 0xD8 and self.config["enable_matrices"]:
-                if hierarchy and len(matrix) > 1:
-                    matrix.pop()
-            # G_MTX
-            elif data[i] == 0xDA and self.config["enable_matrices"]:
-                log.debug("0xDA G_MTX used, but implementation may be faulty")
-                # FIXME: this looks super weird, not sure what it's doing either
-                if hierarchy and data[i + 4] == 0x0D:
-                    if (data[i + 3] & 0x04) == 0:
-                        matrixLimb = hierarchy.getMatrixLimb(unpack_from(">L", data, i + 4)[0])
-                        if (data[i + 3] & 0x02) == 0:
-                            newMatrixLimb = Limb()
-                            newMatrixLimb.index = matrixLimb.index
-                            newMatrixLimb.pos = (Vector([matrixLimb.pos.x, matrixLimb.pos.y, matrixLimb.pos.z]) + matrix[len(matrix) - 1].pos) / 2
-                            matrixLimb = newMatrixLimb
-                        if (data[i + 3] & 0x01) == 0:
-                            matrix.append(matrixLimb)
-                        else:
-                            matrix[len(matrix) - 1] = matrixLimb
+    def addAlreadyRead(self, segment, readRange):
+        for recording in self.recordings:
+            recording.readRanges.append((segment, readRange))
+        self.alreadyRead[segment].add(*readRange)
+
+    def scanCallGraph(self, offset):
+        """
+        Find the display lists called (G_DL, 0xE1) by the display list at offset and, recursively, by those,
+        counting how many commands call each one. Display lists are only scanned once.
+        """
+        stack = [offset]
+        while stack:
+            offset = stack.pop()
+            if offset in self.displayListCalls:
+                continue
+            calls = []
+            if validOffset(self.segment, offset):
+                seg, start = splitOffset(offset)
+                data = self.segment[seg]
+                for i in range(start, len(data) - 7, 8):
+                    opcode = data[i]
+                    if opcode == 0xDE or opcode == 0xE1:
+                        target = unpack_from(">L", data, i + 4)[0]
+                        if validOffset(self.segment, target):
+                            calls.append(target)
+                        if opcode == 0xDE and data[i + 1] != 0x00:
+                            break
+                    elif opcode == 0xDF:
+                        break
+            self.displayListCalls[offset] = calls
+            for target in calls:
+                self.displayListReferences[target] = self.displayListReferences.get(target, 0) + 1
+                stack.append(target)
+
+    def buildRec(self, ctx, offset):
+        # only display lists called from several places may be read again with the same input state
+        if ctx.skipAlreadyRead or self.displayListReferences.get(offset, 0) < 2:
+            self.buildDisplayList(ctx.hierarchy, ctx.limb, offset, mesh_name_format=ctx.mesh_name_format, skipAlreadyRead=ctx.skipAlreadyRead)
+            return
+        key = (
+            offset, ctx.hierarchy, ctx.limb if ctx.hierarchy else None,
+            ctx.mesh_name_format, self.use_transparency, self.config["import_textures"],
+            self.rsp.getKey(),
+        )
+        result = self.displayListMemo.get(key)
+        if result is None:
+            self.displayListMemoMisses += 1
+            result = DisplayListResult()
+            self.recordings.append(result)
+            try:
+                self.buildDisplayList(ctx.hierarchy, ctx.limb, offset, mesh_name_format=ctx.mesh_name_format)
+            finally:
+                self.recordings.pop()
+            result.rsp = self.rsp.copy()
+            self.displayListMemo[key] = result
+        else:
+            self.displayListMemoHits += 1
+            ctx.log.trace(f"Replaying display list 0x{offset:08X}")
+            for mesh, createArgs in result.meshes:
+                self.createMesh(mesh, createArgs)
+            for segment, readRange in result.readRanges:
+                self.addAlreadyRead(segment, readRange)
+            self.rsp = result.rsp.copy()
+
+    def opNoop(self, ctx, i):
+        # not relevant for importing
+        pass
+
+    def opUnimplemented(self, ctx, i):
+        ctx.log.warning(f"Skipped (unimplemented) opcode 0x{ctx.data[i]:02X}")
+
+    # G_LOADTILE, G_TEXRECT, G_SETZIMG, G_SETCIMG (2d "direct" drawing?)
+    def opLogOnly(self, ctx, i):
+        w0, w1 = unpack_from(">LL", ctx.data, i)
+        ctx.log.debug(f"0x{ctx.data[i]:X} {w0:08X} : {w1:08X}")
+
+    def opVertex(self, ctx, i):
+        w0, w1 = unpack_from(">LL", ctx.data, i)
+        count = (w0 >> 12) & 0xFF
+        index = ((w0 & 0xFF) >> 1) - count
+        vaddr = w1
+        if validOffset(self.segment, vaddr + int(16 * count) - 1):
+            vbuf = self.rsp.vbuf
+            pos, uv, normal, color = readVertices(self.segment, vaddr, count, self.config["scale_factor"])
+            vertexLimb = ctx.matrix[len(ctx.matrix) - 1] if ctx.hierarchy else None
+            if vertexLimb:
+                pos += np.array(vertexLimb.pos, dtype=np.float32)
+            slots = np.arange(index, index + count)
+            vbuf.pos[slots] = pos
+            vbuf.uv[slots] = uv
+            vbuf.normal[slots] = normal
+            vbuf.color[slots] = color
+            if ctx.hierarchy:
+                for slot in slots:
+                    vbuf.limb[slot] = vertexLimb
+
+    def opModifyVertex(self, ctx, i):
+        data = ctx.data
+        vbuf = self.rsp.vbuf
+        try:
+            index = ((data[i + 2] & 0x0F) << 3) | (data[i + 3] >> 1)
+            if data[i + 1] == 0x10:
+                # same conversion as readVertices
+                nx, ny, nz = unpack_from("bbb", data, i + 4)
+                vbuf.normal[index] = (nx / 128, -nz / 128, ny / 128)
+                vbuf.color[index] = [c / 255 for c in unpack_from("BBBB", data, i + 4)]
+            elif data[i + 1] == 0x14:
+                vbuf.uv[index] = unpack_from(">hh", data, i + 4)
+        except IndexError:
+            if not ctx.extraLenient:
+                w0, w1 = unpack_from(">LL", data, i)
+                ctx.log.exception(f"Bad vertex indices in 0x02 at 0x{i:X} {w0:08X} {w1:08X}")
+
+    def opTriangles(self, ctx, i):
+        data = ctx.data
+        mesh = ctx.mesh
+        tile = self.rsp.tile[0]
+        if ctx.has_tex:
+            materialKey = self.getMaterialKey(tile)
+            if materialKey in self.material:
+                ctx.material = self.material[materialKey]
+                self.materialHits += 1
+            else:
+                self.materialMisses += 1
+                ctx.material = tile.create(
+                    self.segment, 
+                    self.use_transparency,
+                    self.config["replicate_tex_mirror_blender"],
+                    self.config["enable_tex_mirror_sharp_ocarina_tags"],
+                    self.config["enable_tex_clamp_sharp_ocarina_tags"],
+                    self.config["enable_tex_clamp_blender"],
+                    self.config["fpath"],
+                    prefix=self.prefix,
+                    texture_cache=self.textureCache,
+                    write_texture_files=self.config["write_texture_files"],
+                    images=self.images
+                )
+                # also remember failures (None), they would fail again
+                self.material[materialKey] = ctx.material
+            ctx.has_tex = False
+        if not self.config["import_textures"]:
+            ctx.material = None
+        nbefore_props = ["verts","uvs","colors","vgroups","faces","faces_use_smooth","normals"]
+        nbefore_lengths = [(nbefore_prop, len(getattr(mesh, nbefore_prop))) for nbefore_prop in nbefore_props]
+        try:
+            revert = not self.addTri(ctx, data[i+1], data[i+2], data[i+3])
+            if data[i] == 0x06:
+                revert = revert or not self.addTri(ctx, data[i+4+1], data[i+4+2], data[i+4+3])
+        except:
+            ctx.log.exception(f"Failed to import vertices and/or their data from 0x{i:X}")
+            revert = True
+        if revert:
+            # revert any change
+            for nbefore_prop, nbefore in nbefore_lengths:
+                val_prop = getattr(mesh, nbefore_prop)
+                while len(val_prop) > nbefore:
+                    if nbefore_prop == "verts":
+                        mesh.popVert()
                     else:
-                        matrix.append(matrix[len(matrix) - 1])
-                elif hierarchy:
-                    log.error(f"unknown limb {w0:08X} {w1:08X}")
-            # G_DL
-            elif data[i] == 0xDE:
-                log.trace(f"G_DE at 0x{segmentMask | i:X} {w0:08X}{w1:08X}")
-                #mesh.create(mesh_name_format, hierarchy, offset, self.checkUseNormals())
-                #mesh.__init__()
-                #offset = segmentMask | i
-                if validOffset(self.segment, w1):
-                    buildRec(w1)
-                if data[i + 1] != 0x00:
-                    mesh.create(mesh_name_format, hierarchy, offset, self.checkUseNormals(), prefix=self.prefix)
-                    self.alreadyRead[segment].append((startOffset,i))
-                    return
-            # G_ENDDL
-            elif data[i] == 0xDF:
-                log.trace(f"G_ENDDL at 0x{segmentMask | i:X} {w0:08X}{w1:08X}")
-                mesh.create(mesh_name_format, hierarchy, offset, self.checkUseNormals(), prefix=self.prefix)
-                self.alreadyRead[segment].append((startOffset,i))
-                return
-            # handle "LOD dlists"
-            elif data[i] == 0xE1:
-                # 4 bytes starting at data[i+8+4] is a distance to check for displaying this dlist
-                #mesh.create(mesh_name_format, hierarchy, offset, self.checkUseNormals())
-                #mesh.__init__()
-                #offset = segmentMask | i
-                if validOffset(self.segment, w1):
-                    buildRec(w1)
+                        val_prop.pop()
+
+    # a1 a2 a3 are microcode values
+    def addTri(self, ctx, a1, a2, a3):
+        rsp = self.rsp
+        vbuf = rsp.vbuf
+        mesh = ctx.mesh
+        corners = [a >> 1 for a in (a1,a2,a3)]
+        try:
+            verts_pos = [tuple(pos) for pos in vbuf.pos[corners].tolist()]
+        except IndexError:
+            if ctx.extraLenient:
+                return False
+            raise
+        verts_normal = vbuf.normal[corners].tolist()
+        verts_uv = vbuf.uv[corners].tolist()
+        verts_color = vbuf.color[corners].tolist()
+        verts_index = [mesh.findVert(pos) for pos in verts_pos]
+        for j in range(3):
+            if verts_index[j] is None:
+                verts_index[j] = mesh.addVert(verts_pos[j])
+        mesh.uvs.append(ctx.material)
+        face_normals = []
+        tile = rsp.tile[0]
+        for j in range(3):
+            normal = verts_normal[j]
+            uv = verts_uv[j]
+            vi = verts_index[j]
+            # TODO: is this computation of shadeColor correct?
+            sc = (((normal[0] + normal[1] + normal[2]) / 3) + 1.0) / 2
+            rsp.vertexColor = Vector(verts_color[j])
+            rsp.shadeColor = Vector([sc, sc, sc])
+            mesh.colors.append(self.getCombinerColor())
+            mesh.uvs.append((tile.offset[0] + uv[0] * tile.ratio[0], tile.offset[1] - uv[1] * tile.ratio[1]))
+            if ctx.hierarchy:
+                vertexLimb = vbuf.limb[corners[j]]
+                if vertexLimb:
+                    limb_name = f"limb_{vertexLimb.index:02}"
+                    if not (limb_name in mesh.vgroups):
+                        mesh.vgroups[limb_name] = []
+                    mesh.vgroups[limb_name].append(vi)
+            face_normals.append((vi, tuple(normal)))
+        mesh.faces.append(tuple(verts_index))
+        mesh.faces_use_smooth.append("G_SHADE" in rsp.geometryModeFlags and "G_SHADING_SMOOTH" in rsp.geometryModeFlags)
+        mesh.normals.append(tuple(face_normals))
+        if len(set(verts_index)) < 3 and not ctx.extraLenient:
+            ctx.log.warning(f"Found empty tri! {verts_index}")
+        return True
+
+    def opTexture(self, ctx, i):
+        ctx.log.debug("0xD7 G_TEXTURE used, but unimplemented")
+        # FIXME: ?
+#        for tile in self.rsp.tile:
+#            if ((w1 >> 16) & 0xFFFF) < 0xFFFF:
+#                tile.scale.x = ((w1 >> 16) & 0xFFFF) * 0.0000152587891
+#            else:
+#                tile.scale.x = 1.0
+#            if (w1 & 0xFFFF) < 0xFFFF:
+#                tile.scale.y = (w1 & 0xFFFF) * 0.0000152587891
+#            else:
+#                tile.scale.y = 1.0
+
+    def opPopMatrix(self, ctx, i):
+        if ctx.hierarchy and len(ctx.matrix) > 1:
+            ctx.matrix.pop()
+
+    def opMatrix(self, ctx, i):
+        data = ctx.data
+        matrix = ctx.matrix
+        hierarchy = ctx.hierarchy
+        ctx.log.debug("0xDA G_MTX used, but implementation may be faulty")
+        # FIXME: this looks super weird, not sure what it's doing either
+        if hierarchy and data[i + 4] == 0x0D:
+            if (data[i + 3] & 0x04) == 0:
+                matrixLimb = hierarchy.getMatrixLimb(unpack_from(">L", data, i + 4)[0])
+                if (data[i + 3] & 0x02) == 0:
+                    newMatrixLimb = Limb()
+                    newMatrixLimb.index = matrixLimb.index
+                    newMatrixLimb.pos = (Vector([matrixLimb.pos.x, matrixLimb.pos.y, matrixLimb.pos.z]) + matrix[len(matrix) - 1].pos) / 2
+                    matrixLimb = newMatrixLimb
+                if (data[i + 3] & 0x01) == 0:
+                    matrix.append(matrixLimb)
                 else:
-                    log.warning(f"Invalid 0xE1 offset 0x{w1:04X}, skipping")
-            # G_RDPPIPESYNC
-            elif data[i] == 0xE7:
-                #mesh.create(mesh_name_format, hierarchy, offset, self.checkUseNormals())
-                #mesh.__init__()
-                #offset = segmentMask | i
-                pass
-            elif data[i] == 0xF0:
-                self.palSize = ((w1 & 0x00FFF000) >> 13) + 1
-            elif data[i] == 0xF2:
-                self.curTile.rect.x = (w0 & 0x00FFF000) >> 14
-                self.curTile.rect.y = (w0 & 0x00000FFF) >> 2
-                self.curTile.rect.z = (w1 & 0x00FFF000) >> 14
-                self.curTile.rect.w = (w1 & 0x00000FFF) >> 2
-                self.curTile.dims[0] = (self.curTile.rect.z - self.curTile.rect.x) + 1
-                self.curTile.dims[1] = (self.curTile.rect.w - self.curTile.rect.y) + 1
-                self.curTile.texBytes = int(self.curTile.dims[0] * self.curTile.dims[1]) << 1
-                if (self.curTile.texBytes >> 16) == 0xFFFF:
-                    self.curTile.texBytes = self.curTile.size << 16 >> 15
-                self.curTile.calculateSize(self.config["replicate_tex_mirror_blender"])
-            # G_LOADTILE, G_TEXRECT, G_SETZIMG, G_SETCIMG (2d "direct" drawing?)
-            elif data[i] in (0xF4, 0xE4, 0xFE, 0xFF):
-                log.debug(f"0x{data[i]:X} {w0:08X} : {w1:08X}")
-            # G_SETTILE
-            elif data[i] == 0xF5:
-                self.curTile.texFmt = (w0 >> 21) & 0b111
-                self.curTile.texSiz = (w0 >> 19) & 0b11
-                self.curTile.lineSize = (w0 >> 9) & 0x1FF
-                clamp_mirror = [(w1 >> 8) & 0x03, (w1 >> 18) & 0x03]
-                self.curTile.mirror = [b & 1 != 0 for b in clamp_mirror]
-                self.curTile.wrap = [b & 2 == 0 for b in clamp_mirror]
-                self.curTile.mask.x = (w1 >> 4) & 0x0F
-                self.curTile.mask.y = (w1 >> 14) & 0x0F
-                self.curTile.tshift.x = w1 & 0x0F
-                self.curTile.tshift.y = (w1 >> 10) & 0x0F
-            elif data[i] == 0xFA:
-                self.primColor = Vector([((w1 >> (8*(3-i))) & 0xFF) / 255 for i in range(4)])
-                log.debug(f"new primColor -> {self.primColor!r}")
-                #self.primColor = Vector([min(((w1 >> 24) & 0xFF) / 255, 1.0), min(0.003922 * ((w1 >> 16) & 0xFF), 1.0), min(0.003922 * ((w1 >> 8) & 0xFF), 1.0), min(0.003922 * ((w1) & 0xFF), 1.0)])
-            elif data[i] == 0xFB:
-                self.envColor = Vector([((w1 >> (8*(3-i))) & 0xFF) / 255 for i in range(4)])
-                log.debug(f"new envColor -> {self.envColor!r}")
-                #self.envColor = Vector([min(0.003922 * ((w1 >> 24) & 0xFF), 1.0), min(0.003922 * ((w1 >> 16) & 0xFF), 1.0), min(0.003922 * ((w1 >> 8) & 0xFF), 1.0)])
-                if self.config["invert_env_color"]:
-                    self.envColor = Vector([1 - c for c in self.envColor])
-            elif data[i] == 0xFD:
-                try:
-                    if data[i - 8] == 0xF2:
-                        self.curTile = self.tile[1]
-                    else:
-                        self.curTile = self.tile[0]
-                except:
-                    log.exception(f"Failed to switch texel? at 0x{i:X}")
-                    pass
-                try:
-                    if data[i + 8] == 0xE8:
-                        self.tile[0].palette = w1
-                    else:
-                        self.curTile.data = w1
-                except:
-                    log.exception(f"Failed to switch texel data? at 0x{i:X}")
-                    pass
-                has_tex = True
-            # G_CULLDL, G_BRANCH_Z, G_SETOTHERMODE_L, G_SETOTHERMODE_H, G_RDPLOADSYNC, G_RDPTILESYNC, G_LOADBLOCK,
-            elif data[i] in (0x03,0x04,0xE2,0xE3,0xE6,0xE8,0xF3,):
-                # not relevant for importing
-                pass
-            # G_GEOMETRYMODE
-            elif data[i] == 0xD9:
-                # TODO: do not push mesh if geometry mode doesnt actually change?
-                #mesh.create(mesh_name_format, hierarchy, offset, self.checkUseNormals())
-                #mesh.__init__()
-                #offset = segmentMask | i
-                # https://wiki.cloudmodding.com/oot/F3DZEX#RSP_Geometry_Mode
-                # TODO: SharpOcarina tags
-                geometryModeMasks = {
-                    "G_ZBUFFER":            0b00000000000000000000000000000001,
-                    "G_SHADE":              0b00000000000000000000000000000100, # used by 0x05/0x06 for mesh.faces_use_smooth
-                    "G_CULL_FRONT":         0b00000000000000000000001000000000, # TODO: set culling (not possible per-face or per-material or even per-object apparently) / SharpOcarina tags
-                    "G_CULL_BACK":          0b00000000000000000000010000000000, # TODO: same
-                    "G_FOG":                0b00000000000000010000000000000000,
-                    "G_LIGHTING":           0b00000000000000100000000000000000,
-                    "G_TEXTURE_GEN":        0b00000000000001000000000000000000, # TODO: billboarding?
-                    "G_TEXTURE_GEN_LINEAR": 0b00000000000010000000000000000000, # TODO: billboarding?
-                    "G_SHADING_SMOOTH":     0b00000000001000000000000000000000, # used by 0x05/0x06 for mesh.faces_use_smooth
-                    "G_CLIPPING":           0b00000000100000000000000000000000,
-                }
-                clearbits = ~w0 & 0x00FFFFFF
-                setbits = w1
-                for flagName, flagMask in geometryModeMasks.items():
-                    if clearbits & flagMask:
-                        self.geometryModeFlags.discard(flagName)
-                        clearbits = clearbits & ~flagMask
-                    if setbits & flagMask:
-                        self.geometryModeFlags.add(flagName)
-                        setbits = setbits & ~flagMask
-                log.debug(f"Geometry mode flags as of 0x{i:X}: {self.geometryModeFlags!r}")
-                """
-                # many unknown flags. keeping this commented out for any further research
-                if clearbits:
-                    log.warning(f"Unknown geometry mode flag at 0x{i:X} in clearbits {bin(clearbits)}")
-                if setbits:
-                    log.warning(f"Unknown geometry mode flag at 0x{i:X} in setbits {bin(setbits)}")
-                """
-            # G_SETCOMBINE
-            elif data[i] == 0xFC:
-                # https://wiki.cloudmodding.com/oot/F3DZEX/Opcode_Details#0xFC_.E2.80.94_G_SETCOMBINE
-                pass # TODO:
+                    matrix[len(matrix) - 1] = matrixLimb
             else:
-                log.warning(f"Skipped (unimplemented) opcode 0x{data[i]:02X}")
-        log.warning(f"Reached end of dlist started at 0x{startOffset:X}")
-        mesh.create(mesh_name_format, hierarchy, offset, self.checkUseNormals(), prefix=self.prefix)
-        self.alreadyRead[segment].append((startOffset,endOffset))
+                matrix.append(matrix[len(matrix) - 1])
+        elif hierarchy:
+            w0, w1 = unpack_from(">LL", data, i)
+            ctx.log.error(f"unknown limb {w0:08X} {w1:08X}")
+
+    def opDisplayList(self, ctx, i):
+        w0, w1 = unpack_from(">LL", ctx.data, i)
+        ctx.log.trace(f"G_DE at 0x{(ctx.segment << 24) | i:X} {w0:08X}{w1:08X}")
+        if validOffset(self.segment, w1):
+            self.buildRec(ctx, w1)
+        # branch, the current display list does not continue after the called one
+        if ctx.data[i + 1] != 0x00:
+            self.endDisplayList(ctx, i)
+            return True
+
+    def opEndDisplayList(self, ctx, i):
+        ctx.log.trace(f"G_ENDDL at 0x{(ctx.segment << 24) | i:X} {ctx.data[i:i+8].hex().upper()}")
+        self.endDisplayList(ctx, i)
+        return True
+
+    def opLODDisplayList(self, ctx, i):
+        # 4 bytes starting at data[i+8+4] is a distance to check for displaying this dlist
+        w1 = unpack_from(">L", ctx.data, i + 4)[0]
+        if validOffset(self.segment, w1):
+            self.buildRec(ctx, w1)
+        else:
+            ctx.log.warning(f"Invalid 0xE1 offset 0x{w1:04X}, skipping")
+
+    def opLoadTLUT(self, ctx, i):
+        w1 = unpack_from(">L", ctx.data, i + 4)[0]
+        self.rsp.palSize = ((w1 & 0x00FFF000) >> 13) + 1
+
+    def opSetTileSize(self, ctx, i):
+        w0, w1 = unpack_from(">LL", ctx.data, i)
+        curTile = self.rsp.curTile
+        rect = curTile.rect
+        rect[0] = (w0 & 0x00FFF000) >> 14
+        rect[1] = (w0 & 0x00000FFF) >> 2
+        rect[2] = (w1 & 0x00FFF000) >> 14
+        rect[3] = (w1 & 0x00000FFF) >> 2
+        curTile.dims[0] = (rect[2] - rect[0]) + 1
+        curTile.dims[1] = (rect[3] - rect[1]) + 1
+        curTile.texBytes = int(curTile.dims[0] * curTile.dims[1]) << 1
+        if (curTile.texBytes >> 16) == 0xFFFF:
+            curTile.texBytes = curTile.size << 16 >> 15
+        curTile.calculateSize(self.config["replicate_tex_mirror_blender"])
+
+    def opSetTile(self, ctx, i):
+        w0, w1 = unpack_from(">LL", ctx.data, i)
+        curTile = self.rsp.curTile
+        curTile.texFmt = (w0 >> 21) & 0b111
+        curTile.texSiz = (w0 >> 19) & 0b11
+        curTile.lineSize = (w0 >> 9) & 0x1FF
+        for axis, clamp_mirror in enumerate(((w1 >> 8) & 0x03, (w1 >> 18) & 0x03)):
+            curTile.mirror[axis] = clamp_mirror & 1 != 0
+            curTile.wrap[axis] = clamp_mirror & 2 == 0
+        curTile.mask[0] = (w1 >> 4) & 0x0F
+        curTile.mask[1] = (w1 >> 14) & 0x0F
+        curTile.tshift[0] = w1 & 0x0F
+        curTile.tshift[1] = (w1 >> 10) & 0x0F
+
+    def opSetPrimColor(self, ctx, i):
+        self.rsp.primColor = Vector([c / 255 for c in ctx.data[i+4:i+8]])
+        ctx.log.debug(f"new primColor -> {self.rsp.primColor!r}")
+
+    def opSetEnvColor(self, ctx, i):
+        envColor = Vector([c / 255 for c in ctx.data[i+4:i+8]])
+        ctx.log.debug(f"new envColor -> {envColor!r}")
+        if self.config["invert_env_color"]:
+            envColor = Vector([1 - c for c in envColor])
+        self.rsp.envColor = envColor
+
+    def opSetTextureImage(self, ctx, i):
+        data = ctx.data
+        rsp = self.rsp
+        w1 = unpack_from(">L", data, i + 4)[0]
+        try:
+            if data[i - 8] == 0xF2:
+                rsp.curTile = rsp.tile[1]
+            else:
+                rsp.curTile = rsp.tile[0]
+        except:
+            ctx.log.exception(f"Failed to switch texel? at 0x{i:X}")
+            pass
+        try:
+            if data[i + 8] == 0xE8:
+                rsp.tile[0].palette = w1
+            else:
+                rsp.curTile.data = w1
+        except:
+            ctx.log.exception(f"Failed to switch texel data? at 0x{i:X}")
+            pass
+        ctx.has_tex = True
+
+    def opGeometryMode(self, ctx, i):
+        w0, w1 = unpack_from(">LL", ctx.data, i)
+        geometryModeFlags = self.rsp.geometryModeFlags
+        # TODO: do not push mesh if geometry mode doesnt actually change?
+        # https://wiki.cloudmodding.com/oot/F3DZEX#RSP_Geometry_Mode
+        # TODO: SharpOcarina tags
+        clearbits = ~w0 & 0x00FFFFFF
+        setbits = w1
+        for flagName, flagMask in geometryModeMasks.items():
+            if clearbits & flagMask:
+                geometryModeFlags.discard(flagName)
+                clearbits = clearbits & ~flagMask
+            if setbits & flagMask:
+                geometryModeFlags.add(flagName)
+                setbits = setbits & ~flagMask
+        ctx.log.debug(f"Geometry mode flags as of 0x{i:X}: {geometryModeFlags!r}")
+        """
+        # many unknown flags. keeping this commented out for any further research
+        if clearbits:
+            log.warning(f"Unknown geometry mode flag at 0x{i:X} in clearbits {bin(clearbits)}")
+        if setbits:
+            log.warning(f"Unknown geometry mode flag at 0x{i:X} in setbits {bin(setbits)}")
+        """
 
     def LinkTpose(self, hierarchy):
         log = getLogger("F3DZEX.LinkTpose")
@@ -1613,7 +2297,11 @@ class F3DZEX:
             bpy.ops.pose.transforms_clear()
             bpy.ops.pose.select_all(action="DESELECT")
 
-    def buildAnimation(self, hierarchyMostBones, anim_to_play):
+    def buildAnimation(self, hierarchyMostBones, anim_to_play, decoded=None):
+        """
+        Write the animation to the action of the armature of hierarchyMostBones
+        decoded is the decodeAnimation result for it if already decoded (see decodeAnimations)
+        """
         log = getLogger("F3DZEX.buildAnimation")
 
         segment = self.segment
@@ -1636,86 +2324,126 @@ class F3DZEX:
         AniSeg = AnimationOffset >> 24
         AnimationOffset &= 0xFFFFFF
 
-        Limit = unpack_from(">H", segment[AniSeg], (AnimationOffset + 12))[0] # TODO: no idea what this is
-        
-        frameTotal = unpack_from(">h", segment[AniSeg], (AnimationOffset))[0]
-        rot_vals_addr, RotIndexoffset = unpack_from(">LL", segment[AniSeg], (AnimationOffset + 4))
-
-        rot_vals_addr  &= 0xFFFFFF
-        RotIndexoffset &= 0xFFFFFF
-
-        rot_vals_max_length = int ((RotIndexoffset - rot_vals_addr) / 2)
-        if rot_vals_max_length < 0:
-            log.info("rotation indices (animation data) is located before indexed rotation values, this is weird but fine")
-            rot_vals_max_length = (len(segment[AniSeg]) - rot_vals_addr) // 2
-        rot_vals_cache = []
-        def rot_vals(index, errorDefault=0):
-            if index < 0 or (rot_vals_max_length and index >= rot_vals_max_length):
-                log.trace(f"index in rotations table {index} is out of bounds (rotations table is <= {rot_vals_max_length} long)")
-                return errorDefault
-            if index >= len(rot_vals_cache):
-                rot_vals_cache.extend(unpack_from(">h", segment[AniSeg], (rot_vals_addr) + (j * 2))[0] for j in range(len(rot_vals_cache),index+1))
-                log.trace(f"Computed rot_vals_cache up to {index} {rot_vals_cache!r}")
-            return rot_vals_cache[index]
-
+        if decoded is None:
+            decoded = decodeAnimation(segment[AniSeg], AnimationOffset, BoneCountMax)
+        translations, rotations, rotationsValid = decoded
+        frameTotal = len(translations)
         bpy.context.scene.frame_end = max(frameTotal, bpy.context.scene.frame_end)
-
-        for frame in range(frameTotal):
-            log.log(
-                logging.INFO if (frame + 1) % min(20, max(min(10, frameTotal), frameTotal // 3)) == 0 else logging.DEBUG,
-                f"anim: {currentanim+1}/{self.animTotal} frame: {frame+1}/{frameTotal}")
-
-            # Translations
-            translation = unpack_from(">hhh", segment[AniSeg], RotIndexoffset)
-            translation = [v + frame if v >= Limit else v for v in translation]
-            translation = Vector(rot_vals(v) for v in translation)
-            log.trace(f"X {int(translation.x)} Y {int(translation.z)} Z {int(translation.y)}")
-            translation *= self.config["scale_factor"]
-
-            bone = armature.pose.bones["limb_00"]
-            bone.location += translation
-            bone.keyframe_insert(data_path="location", frame=frame+1)
-            
-            # Rotations
-            log.trace(f"       {frameTotal} Frames {Limit} still values {(rot_vals_max_length - Limit) / frameTotal:f} tracks") # what is this debug message?
-            for bIndx in reversed(range(BoneCountMax)): # Had to reverse here, cuz didn't find a way to rotate bones on LOCAL space, start rotating from last to first bone on hierarchy GLOBAL.
-                if RotIndexoffset + (bIndx * 6) + 10 + 2 > len(segment[AniSeg]):
-                    log.trace(f"Ignoring bone {bIndx} in animation {anim_to_play}, rotation table does not have that many entries")
-                    continue
-
-                rot_index = unpack_from(">hhh", segment[AniSeg], RotIndexoffset + (bIndx * 6) + 6)
-                rot_index_limited = [v + frame if v >= Limit else v for v in rot_index]
-
-                try:
-                    r = Vector(rot_vals(v, None) for v in rot_index_limited)
-                except:
-                    log.trace(f"Ignoring bone {bIndx} in animation {anim_to_play}, rotation table did not have the entry")
-                    continue
-                
-                r /= 182.04444444444444444444 # = 0x10000 / 360
-
-                log.trace(f"limb: {bIndx} XIdx: {rot_index[0]} {rot_index_limited[0]} YIdx: {rot_index[1]} {rot_index_limited[1]} ZIdx: {rot_index[2]} {rot_index_limited[2]} frameTotal: {frameTotal}")
-                log.trace(f"limb: {bIndx} RX {int(r.x)} RZ {int(r.y)} RY {int(r.z)} anim: {currentanim+1} frame: {frame+1} frameTotal: {frameTotal}")
-                
-                r = Vector(radians(v) for v in r)
-
-                if (bIndx > -1):
-                    poseBone = armature.pose.bones[f"limb_{bIndx:02}"]
-                    # TODO: Hoping to figure out a solution that doesn't require rotation ops. Revisit this idea
-                    # rotation = Quaternion()
-                    # rotation.rotate(Euler((RXX, 0, 0)))
-                    # rotation.rotate(Euler((0, RYY, 0)))
-                    # rotation.rotate(Euler((0, 0, -RZZ)))
-                    # poseBone.rotation_quaternion = rotation
-                    # poseBone.rotation_quaternion = rotation
-                    poseBone.bone.select = True
-                    bpy.ops.transform.rotate(value = -r.x, orient_axis="X")
-                    bpy.ops.transform.rotate(value = -r.y, orient_axis="Z")
-                    bpy.ops.transform.rotate(value =  r.z, orient_axis="Y")
-                    poseBone.keyframe_insert(data_path="rotation_quaternion", frame=frame+1)
-                    bpy.ops.pose.select_all(action="DESELECT")
-
-            for bone in armature.data.bones:
-                bone.select = True
-            bpy.ops.pose.transforms_clear()
-            bpy.ops.pose.select_all(action="DESELECT")
+        if frameTotal <= 0:
+            return
+        if not rotationsValid.all():
+            ignoredBones = np.flatnonzero(~rotationsValid.all(axis=0)).tolist()
+            log.debug(f"Some frames of animation {anim_to_play} have no rotation for bones {ignoredBones!r} (rotation tables do not have the entries)")
+        log.debug(f"anim: {currentanim+1}/{self.animTotal} read {frameTotal} frames")
+
+        keyframeCount = writeAnimation(armature.animation_data.action, translations, rotations, rotationsValid, self.config["scale_factor"])
+        log.debug(f"anim: {currentanim+1}/{self.animTotal} wrote {keyframeCount} keyframes, {3 * frameTotal + 4 * int(rotationsValid.sum())} without reducing constant and linear channels")
+
+    def decodeAnimations(self, segment, boneCount):
+        """
+        Decode all animations found by locateAnimations at once, in worker processes which map the segment file
+        Returns the decodeAnimation results in the same order as self.animation, or None if that failed
+        """
+        log = getLogger("F3DZEX.decodeAnimations")
+        path = self.segmentPaths.get(segment)
+        if not path or len(self.animation) < 2:
+            return None
+        python = pythonExecutable()
+        if python is None:
+            log.warning("No Python interpreter to start worker processes with, decoding animations one after another")
+            return None
+        time_start = time.time()
+        workers = min(len(self.animation), os.cpu_count() or 1)
+        try:
+            decoded = decodeAnimationsInWorkers(python, path, self.animation, boneCount, workers)
+        except Exception:
+            log.exception("Could not decode animations in worker processes, decoding them one after another instead")
+            return None
+        log.info(f"Decoded {len(decoded)} animations with {workers} processes in {time.time() - time_start:.2f} sec")
+        return decoded
+
+    def recordAnimations(self, segment):
+        """
+        Record the animations found by locateAnimations on the armatures, without building them.
+        Their actions are built on demand with buildAnimationAction
+        """
+        path = os.path.abspath(self.segmentPaths[segment])
+        boneCount = max(h.limbCount for h in self.hierarchy)
+        for h in self.hierarchy:
+            animations = h.armature.z64_animations
+            animations.clear()
+            for i in range(len(self.animation)):
+                entry = animations.add()
+                entry.name = f"{self.prefix}anim{i+1}_{self.durationAnims[i]}"
+                entry.filepath = path
+                entry.offset = self.offsetAnims[i]
+                entry.frame_count = self.durationAnims[i]
+                entry.bone_count = boneCount
+                entry.scale_factor = self.config["scale_factor"]
+
+# Animations decoded by anim_decode.decodeAnimation to actions, see F3DZEX.buildAnimation
+
+def pythonExecutable():
+    """
+    The Python interpreter to start worker processes with, or None.
+    In Blender 2.80-2.90 sys.executable is Blender itself, bpy.app.binary_path_python is the bundled Python
+    """
+    return findPythonInterpreter((getattr(bpy.app, "binary_path_python", None), sys.executable))
+
+def writeFCurve(action, dataPath, index, group, frames, values, linear):
+    """
+    Add to action an F-Curve keyed with values at frames, interpolated linearly if linear (see anim_decode.reduceTrack)
+    Returns the amount of keyframes written
+    """
+    co = np.empty((len(frames), 2), dtype=np.float32)
+    co[:, 0] = frames
+    co[:, 1] = values
+    fcurve = action.fcurves.new(dataPath, index=index, action_group=group)
+    fcurve.keyframe_points.add(len(co))
+    fcurve.keyframe_points.foreach_set("co", co.ravel())
+    if linear:
+        for keyframe in fcurve.keyframe_points:
+            keyframe.interpolation = "LINEAR"
+    fcurve.update()
+    return len(co)
+
+def writeAnimation(action, translations, rotations, rotationsValid, scale_factor):
+    """
+    Write to action the F-Curves for an animation decoded by anim_decode.decodeAnimation
+    Returns the amount of keyframes written
+    """
+    # pose bones are in the same space as the game's limbs (see Limb.read and Hierarchy.create),
+    # so the root location is the game translation and rotations are the game's X then Y then Z rotations
+    frameTotal, boneCount = rotationsValid.shape
+    if frameTotal <= 0:
+        return 0
+    frames = np.arange(1, frameTotal + 1)
+    keyframeCount = 0
+    # constant and linear channels are found on the game's integer values, before scaling or converting them
+    for index in range(3):
+        keyed, linear = reduceTrack(translations[:, index])
+        keyframeCount += writeFCurve(action, 'pose.bones["limb_00"].location', index, "limb_00",
+            frames[keyed], translations[keyed, index] * scale_factor, linear)
+    for bIndx in range(boneCount):
+        valid = rotationsValid[:, bIndx]
+        if not valid.any():
+            continue
+        boneName = f"limb_{bIndx:02}"
+        # quaternions don't change linearly with angles, only constant rotations are reduced
+        keyed, _ = reduceTrack(rotations[valid, bIndx], linear=False)
+        quaternions = makeQuaternionsContinuous(eulerXYZToQuaternions(rotations[valid, bIndx][keyed] * (2 * pi / 0x10000)))
+        for index in range(4):
+            keyframeCount += writeFCurve(action, f'pose.bones["{boneName}"].rotation_quaternion', index, boneName,
+                frames[valid][keyed], quaternions[:, index], False)
+    return keyframeCount
+
+def buildAnimationAction(name, path, offset, boneCount, scale_factor):
+    """
+    Build a new action named name from the animation at segmented offset in the file at path,
+    for boneCount bones. Returns the action and the animation frame count
+    """
+    translations, rotations, rotationsValid = decodeAnimationFile(path, offset & 0xFFFFFF, boneCount)
+    action = bpy.data.actions.new(name)
+    action.use_fake_user = True
+    writeAnimation(action, translations, rotations, rotationsValid, scale_factor)
+    return action, len(translations)
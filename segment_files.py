@@ -0,0 +1,119 @@
+# Finding the files other segments are loaded from
+# Does not use bpy, but logs with the addon's log module, so it is imported as part of the addon package
+
+import os
+
+from .log import getLogger
+
+class DirectoryListing:
+    def __init__(self, directory):
+        self.directory = directory
+        # entry names in os.listdir order, and file names by os.path.normcase'd name (matching like os.path.isfile does)
+        self.names = []
+        self.byNormcase = {}
+        try:
+            with os.scandir(directory or ".") as it:
+                for entry in it:
+                    self.names.append(entry.name)
+                    if entry.is_file():
+                        self.byNormcase.setdefault(os.path.normcase(entry.name), entry.name)
+        except OSError:
+            getLogger("DirectoryListing").exception(f"Could not list files in {directory}")
+        self.manifest = self.readManifest()
+
+    def find(self, name):
+        """Returns the path to the file named name in the directory, or None"""
+        name = self.byNormcase.get(os.path.normcase(name))
+        return os.path.join(self.directory, name) if name else None
+
+    def readManifest(self):
+        """
+        Read segments.txt, where each line is a segment number in hex and the file to load it from,
+        relative to the directory, for example "02 spot04_scene.zscene". Text after # is ignored.
+        Returns segment -> path
+        """
+        log = getLogger("DirectoryListing.readManifest")
+        manifest = {}
+        path = self.find(SegmentFileFinder.manifest_name)
+        if not path:
+            return manifest
+        try:
+            with open(path, "r") as file:
+                lines = file.readlines()
+        except OSError:
+            log.exception(f"Could not read {path}")
+            return manifest
+        for lineNumber, line in enumerate(lines, 1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            parts = line.split(None, 1)
+            try:
+                segment = int(parts[0], 16)
+            except ValueError:
+                segment = None
+            if len(parts) != 2 or segment is None or not (0 <= segment < 16):
+                log.error(f"{path}:{lineNumber}: expected a segment number (hex, 00-0F) and a file name, skipping {line!r}")
+                continue
+            segmentPath = os.path.join(self.directory, parts[1].strip())
+            if not os.path.isfile(segmentPath):
+                log.error(f"{path}:{lineNumber}: file {segmentPath} for segment 0x{segment:02X} does not exist, skipping")
+                continue
+            manifest[segment] = segmentPath
+        log.info(f"Read {len(manifest)} segment files from {path}")
+        return manifest
+
+class SegmentFileFinder:
+    """
+    Finds the files to load other segments from when importing files, listing each directory only once.
+    Files listed in a segments.txt manifest (see DirectoryListing.readManifest) are used first,
+    else files are found by name the same way as without a manifest.
+    """
+    manifest_name = "segments.txt"
+
+    def __init__(self):
+        self.listings = {} # directory -> DirectoryListing
+
+    def getListing(self, directory):
+        key = os.path.normcase(os.path.abspath(directory))
+        listing = self.listings.get(key)
+        if listing is None:
+            listing = DirectoryListing(directory)
+            self.listings[key] = listing
+        return listing
+
+    def findSceneFile(self, directory, fname):
+        """
+        Find the file to load segment 2 (scene segment) from, for the file named fname (without extension) in directory.
+        Uses [room file prefix]_scene then [same].zscene then segment_02.zdata then falls back to any .zscene
+        """
+        log = getLogger("SegmentFileFinder.findSceneFile")
+        listing = self.getListing(directory)
+        if 2 in listing.manifest:
+            return listing.manifest[2]
+        scene_file = None
+        if "_room" in fname:
+            scene_name = f"{fname[:fname.index('_room')]}_scene"
+            scene_file = listing.find(scene_name) or listing.find(f"{scene_name}.zscene")
+        if not scene_file:
+            scene_file = listing.find("segment_02.zdata")
+        if not scene_file:
+            scene_name = None
+            for f in listing.names:
+                if f.endswith(".zscene"):
+                    if scene_name:
+                        log.warning(f"Found another .zscene file {f}, keeping {os.path.join(directory, scene_name)}")
+                    else:
+                        scene_name = f
+            # the first one is used even if it is a directory, in which case nothing is loaded
+            if scene_name:
+                scene_file = listing.find(scene_name)
+        return scene_file
+
+    def findSegmentFile(self, directory, segment):
+        """Find the file to load segment (other than 2) from, segment_XX.zdata where XX is the segment number in hex"""
+        listing = self.getListing(directory)
+        if segment in listing.manifest:
+            return listing.manifest[segment]
+        # I was told this is "ZRE" naming?
+        return listing.find(f"segment_{segment:02X}.zdata")
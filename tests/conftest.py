@@ -0,0 +1,5 @@
+# Tests only cover modules that don't depend on bpy, imported as top-level modules from the addon directory
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
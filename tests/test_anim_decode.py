@@ -0,0 +1,241 @@
+# anim_decode on synthetic animations
+
+import mmap
+import struct
+import sys
+from math import pi
+
+import numpy as np
+import pytest
+
+import anim_decode
+from anim_decode import (
+    readAnimationHeader,
+    rotationValuesLength,
+    decodeAnimation,
+    decodeAnimationFile,
+    decodeAnimationsInWorkers,
+    findPythonInterpreter,
+    eulerXYZToQuaternions,
+    makeQuaternionsContinuous,
+    reduceTrack,
+)
+
+def makeAnimation(frameCount, limit, values, indices, valuesFirst=True, padding=b""):
+    """
+    Animation data with the header at offset 0, then the values (s16) and indices (s16, 3 for the root translation
+    then 3 per bone) tables in the given order, then padding
+    """
+    valuesData = struct.pack(f">{len(values)}h", *values)
+    indicesData = struct.pack(f">{len(indices)}h", *indices)
+    if valuesFirst:
+        valuesOffset, indicesOffset = 16, 16 + len(valuesData)
+        tables = valuesData + indicesData
+    else:
+        indicesOffset, valuesOffset = 16, 16 + len(indicesData)
+        tables = indicesData + valuesData
+    header = struct.pack(">hhLLHH", frameCount, 0, 0x06000000 | valuesOffset, 0x06000000 | indicesOffset, limit, 0)
+    return header + tables + padding
+
+def test_read_header():
+    data = makeAnimation(5, 2, [1, 2, 3], [0, 0, 0])
+    assert readAnimationHeader(data, 0) == (5, 16, 22, 2)
+
+def test_constant_and_incremented_indices():
+    # indices below the limit (2) are the same every frame, others are incremented every frame
+    values = [10, 20, 100, 101, 102, 103, 104]
+    data = makeAnimation(4, 2, values, [0, 1, 2, 1, 0, 3])
+    translation, rotations, valid = decodeAnimation(data, 0, 1)
+    assert translation.dtype == np.int16 and rotations.dtype == np.int16
+    assert translation.tolist() == [[10, 20, 100 + f] for f in range(4)]
+    assert rotations[:, 0].tolist() == [[20, 10, 101 + f] for f in range(4)]
+    assert valid.all()
+
+def test_out_of_range_rotations_are_invalid():
+    values = [10, 20, 30, 40]
+    # bone 0: constant out of range index, bone 1: incremented index leaving the table at frame 2, bone 2: negative index
+    data = makeAnimation(3, 1, values, [0, 0, 0, 0, 9, 0, 0, 2, 0, -1, 0, 0])
+    translation, rotations, valid = decodeAnimation(data, 0, 3)
+    assert valid.tolist() == [[False, True, False], [False, True, False], [False, False, False]]
+    assert rotations[:, 1].tolist() == [[10, 30, 10], [10, 40, 10], [0, 0, 0]]
+    assert not rotations[:, 0].any() and not rotations[:, 2].any()
+
+def test_out_of_range_translation_is_zero():
+    # behavior change: the former buildAnimation raised when reading translation values past the end of data
+    data = makeAnimation(2, 0, [7, 8], [0, 1, 2])
+    translation, _, _ = decodeAnimation(data, 0, 0)
+    assert translation.tolist() == [[7, 8, 0], [8, 0, 0]]
+
+def test_truncated_index_table():
+    # indices for the translation and 2 bones, then not enough data (4 bytes) for a third bone
+    values = [1, 2, 3]
+    data = makeAnimation(2, 3, values, [0, 1, 2, 0, 0, 0, 1, 1, 1], padding=b"\0" * 4)
+    translation, rotations, valid = decodeAnimation(data, 0, 5)
+    assert rotations.shape == (2, 5, 3) and valid.shape == (2, 5)
+    assert valid.tolist() == [[True, True, False, False, False]] * 2
+    assert rotations[:, :2].tolist() == [[[1, 1, 1], [2, 2, 2]]] * 2
+
+def test_values_after_indices():
+    # the values table is until the end of data when it is after the index table
+    values = [5, 6, 7, 8]
+    data = makeAnimation(2, 0, values, [0, 1, 2, 3, 2, 1], valuesFirst=False)
+    _, _, indicesOffset, _ = readAnimationHeader(data, 0)
+    assert rotationValuesLength(len(data), 16 + 12, indicesOffset) == 4
+    translation, rotations, valid = decodeAnimation(data, 0, 1)
+    assert translation.tolist() == [[5, 6, 7], [6, 7, 8]]
+    assert valid.tolist() == [[True], [False]]
+    assert rotations[0, 0].tolist() == [8, 7, 6]
+
+def test_rotation_values_length():
+    # up to the index table when it is after the values
+    assert rotationValuesLength(100, 16, 40) == 12
+    # behavior change: clamped to the data size (values past it used to raise when read)
+    assert rotationValuesLength(30, 16, 40) == 7
+    # the index table at or before the values: until the end of data
+    assert rotationValuesLength(100, 16, 16) == 42
+    assert rotationValuesLength(100, 40, 16) == 30
+
+def test_no_frames():
+    data = makeAnimation(0, 0, [1], [0, 0, 0])
+    translation, rotations, valid = decodeAnimation(data, 0, 4)
+    assert translation.shape == (0, 3) and rotations.shape == (0, 4, 3) and valid.shape == (0, 4)
+
+def test_decode_with_offset():
+    data = makeAnimation(3, 1, [1, 2, 3, 4], [0, 1, 1, 2, 2, 2])
+    # the header is at offset 0x20 in the segment, table offsets are relative to the segment
+    shifted = bytearray(b"\xAA" * 0x20 + data)
+    struct.pack_into(">LL", shifted, 0x24, 0x06000000 | (16 + 0x20), 0x06000000 | (24 + 0x20))
+    expected = decodeAnimation(data, 0, 1)
+    for a, b in zip(decodeAnimation(bytes(shifted), 0x20, 1), expected):
+        assert np.array_equal(a, b)
+
+def test_decode_animation_file(tmp_path, monkeypatch):
+    data = makeAnimation(3, 1, [1, 2, 3, 4], [0, 1, 1, 2, 2, 2])
+    path = tmp_path / "object.zobj"
+    path.write_bytes(data)
+    maps = []
+    class RecordingMmap(mmap.mmap):
+        def __init__(self, *args, **kwargs):
+            maps.append(self)
+    monkeypatch.setattr(anim_decode.mmap, "mmap", RecordingMmap)
+    translation, rotations, valid = decodeAnimationFile(str(path), 0, 1)
+    # the mapping is closed, and the results don't refer to it
+    assert len(maps) == 1 and maps[0].closed
+    for a, b in zip((translation, rotations, valid), decodeAnimation(data, 0, 1)):
+        assert np.array_equal(a, b)
+    # the file isn't kept open either, it can be replaced
+    path.write_bytes(b"")
+
+def makeAnimationFile(path, count):
+    """Write count animations one after another to path, returns their offsets"""
+    data, offsets = b"", []
+    for k in range(count):
+        offsets.append(len(data))
+        animation = makeAnimation(3 + k, 2, [k, 2 * k, 100, 101, 102, 103, 104, 105, 106, 107], [0, 1, 2, 1, 0, 3, 2, 2, 1])
+        # table offsets are relative to the file
+        animation = bytearray(animation)
+        valuesOffset, indicesOffset = struct.unpack_from(">LL", animation, 4)
+        struct.pack_into(">LL", animation, 4, valuesOffset + len(data), indicesOffset + len(data))
+        data += bytes(animation)
+    path.write_bytes(data)
+    return data, offsets
+
+@pytest.mark.parametrize("workerCount", [1, 2, 8])
+def test_decode_animations_in_workers(tmp_path, workerCount):
+    path = tmp_path / "object.zobj"
+    data, offsets = makeAnimationFile(path, 5)
+    decoded = decodeAnimationsInWorkers(sys.executable, str(path), offsets, 2, workerCount)
+    assert len(decoded) == len(offsets)
+    for offset, result in zip(offsets, decoded):
+        for a, b in zip(result, decodeAnimation(data, offset, 2)):
+            assert a.dtype == b.dtype and np.array_equal(a, b)
+
+def test_decode_animations_in_workers_failures(tmp_path):
+    # callers decode one after another when workers raise
+    path = tmp_path / "object.zobj"
+    data, offsets = makeAnimationFile(path, 2)
+    with pytest.raises(RuntimeError):
+        decodeAnimationsInWorkers(sys.executable, str(path), offsets + [len(data) + 16], 2, 2)
+    with pytest.raises(OSError):
+        decodeAnimationsInWorkers(str(tmp_path / "python-missing"), str(path), offsets, 2, 2)
+
+def test_find_python_interpreter():
+    # Blender 2.80-2.90: sys.executable is Blender, bpy.app.binary_path_python the bundled Python
+    assert findPythonInterpreter(("/opt/blender/2.90/python/bin/python3.7m", "/opt/blender/blender")) == "/opt/blender/2.90/python/bin/python3.7m"
+    # no interpreter: decodeAnimations decodes one after another
+    assert findPythonInterpreter((None, "/usr/bin/blender")) is None
+    assert findPythonInterpreter(()) is None
+
+def test_reduce_constant_track():
+    keyed, linear = reduceTrack(np.array([5, 5, 5, 5], dtype=np.int16))
+    assert keyed.tolist() == [0] and not linear
+    # a single frame, and rows of values (X, Y, Z rotations) equal on every frame
+    assert reduceTrack(np.array([7], dtype=np.int16))[0].tolist() == [0]
+    keyed, _ = reduceTrack(np.array([[1, 2, 3]] * 4, dtype=np.int16), linear=False)
+    assert keyed.tolist() == [0]
+
+def test_reduce_linear_track():
+    keyed, linear = reduceTrack(np.array([10, 7, 4, 1, -2], dtype=np.int16))
+    assert keyed.tolist() == [0, 4] and linear
+    # steps are compared exactly, without wrapping around int16
+    keyed, linear = reduceTrack(np.array([32766, 32767, -32768], dtype=np.int16))
+    assert keyed.tolist() == [0, 1, 2] and not linear
+    keyed, linear = reduceTrack(np.array([-30000, 0, 30000], dtype=np.int16))
+    assert keyed.tolist() == [0, 2] and linear
+
+def test_reduce_keeps_other_tracks():
+    # off by one from linear
+    keyed, linear = reduceTrack(np.array([0, 3, 6, 10], dtype=np.int16))
+    assert keyed.tolist() == [0, 1, 2, 3] and not linear
+    # linear but not allowed to be reduced as such (rotations), or changing in one column only
+    keyed, linear = reduceTrack(np.array([0, 1, 2], dtype=np.int16), linear=False)
+    assert keyed.tolist() == [0, 1, 2] and not linear
+    keyed, _ = reduceTrack(np.array([[0, 0, 0], [0, 1, 0]], dtype=np.int16), linear=False)
+    assert keyed.tolist() == [0, 1]
+    # two different frames are kept as they are
+    keyed, linear = reduceTrack(np.array([1, 2], dtype=np.int16))
+    assert keyed.tolist() == [0, 1] and not linear
+    assert reduceTrack(np.zeros(0, dtype=np.int16))[0].tolist() == []
+
+def test_reduce_decoded_tracks():
+    # translation: X constant, Y incremented by the values table, Z not linear; bone 0 constant, bone 1 changing
+    values = [0, 50, 100, 101, 102, 103, 200, 300, 300, 400, 900]
+    data = makeAnimation(4, 2, values, [1, 2, 6, 0, 0, 1, 0, 0, 3])
+    translation, rotations, valid = decodeAnimation(data, 0, 2)
+    assert [reduceTrack(translation[:, i])[0].tolist() for i in range(3)] == [[0], [0, 3], [0, 1, 2, 3]]
+    assert reduceTrack(rotations[valid[:, 0], 0], linear=False)[0].tolist() == [0]
+    assert reduceTrack(rotations[valid[:, 1], 1], linear=False)[0].tolist() == [0, 1, 2, 3]
+
+def rotationMatrix(axis, angle):
+    c, s = np.cos(angle), np.sin(angle)
+    return {
+        "X": np.array([[1, 0, 0], [0, c, -s], [0, s, c]]),
+        "Y": np.array([[c, 0, s], [0, 1, 0], [-s, 0, c]]),
+        "Z": np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]]),
+    }[axis]
+
+def quaternionMatrix(q):
+    w, x, y, z = q
+    return np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)],
+        [2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)],
+        [2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)],
+    ])
+
+def test_euler_xyz_to_quaternions():
+    rng = np.random.default_rng(0)
+    angles = rng.uniform(-pi, pi, (4, 5, 3))
+    quaternions = eulerXYZToQuaternions(angles)
+    assert quaternions.shape == (4, 5, 4)
+    for angle, q in zip(angles.reshape(-1, 3), quaternions.reshape(-1, 4)):
+        # rotating around X, then Y, then Z
+        expected = rotationMatrix("Z", angle[2]) @ rotationMatrix("Y", angle[1]) @ rotationMatrix("X", angle[0])
+        assert np.allclose(quaternionMatrix(q), expected)
+
+def test_make_quaternions_continuous():
+    rng = np.random.default_rng(1)
+    quaternions = eulerXYZToQuaternions(np.cumsum(rng.uniform(-0.5, 0.5, (50, 3)), axis=0))
+    signs = rng.choice((-1, 1), 50)
+    continuous = makeQuaternionsContinuous(quaternions * signs[:, None])
+    assert np.all(np.einsum("ij,ij->i", continuous[1:], continuous[:-1]) >= 0)
+    assert np.allclose(np.abs(continuous), np.abs(quaternions))
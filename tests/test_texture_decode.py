@@ -0,0 +1,147 @@
+# Parity of texture_decode with the per-texel TGA writing it replaced (Tile.writeImageData / Tile.writePalette)
+
+import itertools
+import random
+from math import floor
+from struct import pack, unpack_from
+
+import numpy as np
+import pytest
+
+from texture_decode import (
+    supported_formats,
+    decodeTexels,
+    decodePalette,
+    fallbackTexels,
+    fallbackPalette,
+    toTGAImageData,
+    toTGAPalette,
+)
+
+def referenceImageData(data, offset, texFmt, texSiz, width, height, flip):
+    """TGA image data as written by the former Tile.writeImageData, texel by texel"""
+    bpp = (0.5,1,2,4)[texSiz]
+    lineSize = width * bpp
+    out = []
+    height_range = range(height)
+    if flip[1]:
+        height_range = list(height_range) + list(reversed(height_range))
+    else:
+        height_range = reversed(height_range)
+    for i in height_range:
+        off = offset + int(i * lineSize)
+        line = []
+        j = 0
+        while j < int(width * bpp):
+            if bpp < 2: # 0.5, 1
+                color = unpack_from("B", data, off + int(floor(j)))[0]
+                if bpp == 0.5:
+                    color = ((color >> 4) if j % 1 == 0 else color) & 0xF
+            elif bpp == 2:
+                color = unpack_from(">H", data, off + j)[0]
+            else: # 4
+                color = unpack_from(">L", data, off + j)[0]
+            if texFmt == 0: # RGBA
+                if texSiz == 2: # RGBA16
+                    r = ((color >> 11) & 0b11111) * 255 // 31
+                    g = ((color >> 6) & 0b11111) * 255 // 31
+                    b = ((color >> 1) & 0b11111) * 255 // 31
+                    a = (color & 1) * 255
+                elif texSiz == 3: # RGBA32
+                    r = (color >> 24) & 0xFF
+                    g = (color >> 16) & 0xFF
+                    b = (color >> 8) & 0xFF
+                    a = color & 0xFF
+            elif texFmt == 2: # CI
+                p = color
+            elif texFmt == 3: # IA
+                if texSiz == 0: # IA4
+                    r = g = b = (color >> 1) * 255 // 7
+                    a = (color & 1) * 255
+                elif texSiz == 1: # IA8
+                    r = g = b = (color >> 4) * 255 // 15
+                    a = (color & 0xF) * 255 // 15
+                elif texSiz == 2: # IA16
+                    r = g = b = color >> 8
+                    a = color & 0xFF
+            elif texFmt == 4: # I
+                if texSiz == 0: # I4
+                    r = g = b = a = color * 255 // 15
+                elif texSiz == 1: # I8
+                    r = g = b = a = color
+            if texFmt == 2: # CI
+                line.append(p)
+            else:
+                line.append((b << 24) | (g << 16) | (r << 8) | a)
+            j += bpp
+        lines = [line, line[::-1]] if flip[0] else [line]
+        for line in lines:
+            if texFmt == 2: # CI
+                out.append(pack("B" * len(line), *line))
+            else:
+                out.append(pack(">" + "L" * len(line), *line))
+    return b"".join(out)
+
+def referencePalette(data, offset, palSize):
+    """TGA palette data as written by the former Tile.writePalette"""
+    out = []
+    for i in range(palSize):
+        color = unpack_from(">H", data, offset + i * 2)[0]
+        r = int(255/31 * ((color >> 11) & 0b11111))
+        g = int(255/31 * ((color >> 6) & 0b11111))
+        b = int(255/31 * ((color >> 1) & 0b11111))
+        a = 255 * (color & 1)
+        out.append(pack("BBBB", b, g, r, a))
+    return b"".join(out)
+
+def referenceFallbackImageData(texFmt, width, height, flip):
+    """Fallback TGA image data as written by the former Tile.writeImageData for invalid offsets or formats"""
+    size = width * height
+    for x in [2 if f else 1 for f in flip]:
+        size *= x
+    if texFmt == 2: # CI (paletted)
+        return pack("B", 0) * size
+    return pack(">L", 0x000000FF) * size
+
+flips = list(itertools.product((False, True), repeat=2))
+
+def test_supported_formats():
+    assert supported_formats == {(0, 2), (0, 3), (2, 0), (2, 1), (3, 0), (3, 1), (3, 2), (4, 0), (4, 1)}
+
+@pytest.mark.parametrize("texFmt,texSiz", sorted(supported_formats))
+@pytest.mark.parametrize("width,height", [(1, 1), (3, 2), (5, 3), (8, 4), (7, 7), (16, 5), (32, 32)])
+@pytest.mark.parametrize("flip", flips)
+def test_decode_texels_parity(texFmt, texSiz, width, height, flip):
+    rng = random.Random(hash((texFmt, texSiz, width, height)))
+    offset = rng.randrange(0, 8)
+    data = bytes(rng.randrange(256) for _ in range(offset + width * height * 4 + 8))
+    pixels = decodeTexels(memoryview(data), offset, texFmt, texSiz, width, height, flip)
+    assert toTGAImageData(pixels) == referenceImageData(data, offset, texFmt, texSiz, width, height, flip)
+
+def test_decode_texels_unsupported():
+    assert decodeTexels(bytes(64), 0, 1, 2, 4, 4) is None
+    assert decodeTexels(bytes(64), 0, 4, 2, 4, 4) is None
+
+@pytest.mark.parametrize("palSize", [16, 256])
+def test_decode_palette_parity(palSize):
+    rng = random.Random(palSize)
+    data = bytes(rng.randrange(256) for _ in range(palSize * 2 + 6))
+    assert toTGAPalette(decodePalette(data, 6, palSize)) == referencePalette(data, 6, palSize)
+
+def test_decode_palette_all_colors():
+    data = np.arange(0x10000, dtype=">u2").tobytes()
+    assert toTGAPalette(decodePalette(data, 0, 0x10000)) == referencePalette(data, 0, 0x10000)
+
+@pytest.mark.parametrize("texFmt", [0, 2, 3, 4])
+@pytest.mark.parametrize("width,height", [(1, 1), (3, 5), (32, 16)])
+@pytest.mark.parametrize("flip", flips)
+def test_fallback_texels_parity(texFmt, width, height, flip):
+    pixels = fallbackTexels(texFmt, width, height, flip)
+    assert toTGAImageData(pixels) == referenceFallbackImageData(texFmt, width, height, flip)
+
+@pytest.mark.parametrize("palSize", [16, 256])
+def test_fallback_palette(palSize):
+    # deliberate change: the former black fallback palette was written with pack("L", 0) per entry,
+    # which is 8 bytes on 64-bit Linux/macOS, the palette now always has 4 bytes (BGRA) per entry like valid palettes
+    palette = toTGAPalette(fallbackPalette(palSize))
+    assert palette == bytes(4 * palSize)
@@ -0,0 +1,222 @@
+# N64 texture decoding, whole textures at once with numpy
+# Does not depend on bpy, so it can be used from anywhere
+
+import hashlib
+import os
+import time
+
+import numpy as np
+
+# texSiz -> bytes (not bits) per pixel
+texel_bytes_per_pixel = (0.5, 1, 2, 4)
+
+# (texFmt, texSiz) combinations that can be decoded
+supported_formats = {
+    (0, 2), (0, 3), # RGBA16, RGBA32
+    #(1, -1), # YUV ? "not used in z64 games"
+    (2, 0), (2, 1), # CI4, CI8
+    (3, 0), (3, 1), (3, 2), # IA4, IA8, IA16
+    (4, 0), (4, 1), # I4, I8
+}
+
+def decodeTexels(data, offset, texFmt, texSiz, width, height, flip=(False, False)):
+    """
+    Decode a width x height texture starting at offset in data (bytes-like).
+    Returns a (height, width, 4) uint8 RGBA array, or for CI formats a (height, width) uint8 array
+    of palette indices. Row 0 is the first row in memory (top of the texture).
+    flip replicates mirroring by appending the mirrored texture to the right (flip[0]) and/or bottom (flip[1]).
+    Returns None if the format is not supported.
+    """
+    if (texFmt, texSiz) not in supported_formats:
+        return None
+    bpp = texel_bytes_per_pixel[texSiz]
+    lineSize = width * bpp
+    # same rounding as reading texel j of line i at offset + int(i * lineSize) + int(j * bpp)
+    lineBytes = int(lineSize)
+    texelCount = int(lineBytes / bpp)
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    lineStarts = offset + (np.arange(height) * lineSize).astype(np.int64)
+    raw = buffer[lineStarts[:, None] + np.arange(lineBytes)[None, :]]
+
+    if bpp == 0.5:
+        color = np.empty((height, texelCount), dtype=np.uint8)
+        color[:, 0::2] = raw >> 4
+        color[:, 1::2] = raw & 0xF
+    elif bpp == 1:
+        color = raw
+    elif bpp == 2:
+        color = (raw[:, 0::2].astype(np.uint32) << 8) | raw[:, 1::2]
+    else: # 4
+        color = raw.reshape(height, texelCount, 4)
+
+    if texFmt == 2: # CI
+        pixels = color.astype(np.uint8)
+    else:
+        pixels = np.empty((height, texelCount, 4), dtype=np.uint8)
+        r, g, b, a = (pixels[..., c] for c in range(4))
+        if texFmt == 0: # RGBA
+            if texSiz == 2: # RGBA16
+                r[...] = ((color >> 11) & 0b11111) * 255 // 31
+                g[...] = ((color >> 6) & 0b11111) * 255 // 31
+                b[...] = ((color >> 1) & 0b11111) * 255 // 31
+                a[...] = (color & 1) * 255
+            else: # RGBA32
+                pixels[...] = color
+        elif texFmt == 3: # IA
+            if texSiz == 0: # IA4
+                r[...] = (color >> 1).astype(np.uint32) * 255 // 7
+                a[...] = (color & 1) * 255
+            elif texSiz == 1: # IA8
+                r[...] = (color >> 4).astype(np.uint32) * 255 // 15
+                a[...] = (color & 0xF).astype(np.uint32) * 255 // 15
+            else: # IA16
+                r[...] = color >> 8
+                a[...] = color & 0xFF
+            g[...] = r
+            b[...] = r
+        else: # I
+            if texSiz == 0: # I4
+                r[...] = color.astype(np.uint32) * 255 // 15
+            else: # I8
+                r[...] = color
+            g[...] = r
+            b[...] = r
+            a[...] = r
+
+    if flip[0]:
+        pixels = np.concatenate((pixels, pixels[:, ::-1]), axis=1)
+    if flip[1]:
+        pixels = np.concatenate((pixels, pixels[::-1]), axis=0)
+    return pixels
+
+def decodePalette(data, offset, count):
+    """Decode count RGBA16 palette entries at offset in data, returns a (count, 4) uint8 RGBA array"""
+    color = np.frombuffer(data, dtype=">u2", count=count, offset=offset)
+    palette = np.empty((count, 4), dtype=np.uint8)
+    palette[:, 0] = (255/31 * ((color >> 11) & 0b11111)).astype(np.uint8)
+    palette[:, 1] = (255/31 * ((color >> 6) & 0b11111)).astype(np.uint8)
+    palette[:, 2] = (255/31 * ((color >> 1) & 0b11111)).astype(np.uint8)
+    palette[:, 3] = 255 * (color & 1)
+    return palette
+
+def fallbackTexels(texFmt, width, height, flip=(False, False)):
+    """
+    Pixels to use when a texture can't be decoded, shaped like decodeTexels results:
+    opaque black, or palette index 0 for CI formats
+    """
+    shape = [height * (2 if flip[1] else 1), width * (2 if flip[0] else 1)]
+    if texFmt == 2: # CI
+        return np.zeros(shape, dtype=np.uint8)
+    pixels = np.zeros(shape + [4], dtype=np.uint8)
+    pixels[..., 3] = 0xFF
+    return pixels
+
+def fallbackPalette(count):
+    """Palette to use when a palette can't be decoded, shaped like decodePalette results: transparent black"""
+    return np.zeros((count, 4), dtype=np.uint8)
+
+def toTGAImageData(pixels):
+    """
+    Convert decoded pixels (see decodeTexels) to TGA image data:
+    rows bottom to top, BGRA for truecolor, indices as is for CI
+    """
+    pixels = pixels[::-1]
+    if pixels.ndim == 3:
+        pixels = pixels[..., (2, 1, 0, 3)]
+    return np.ascontiguousarray(pixels).tobytes()
+
+def toTGAPalette(palette):
+    """Convert a decoded palette (see decodePalette) to TGA palette data (BGRA)"""
+    return np.ascontiguousarray(palette[:, (2, 1, 0, 3)]).tobytes()
+
+class TextureCache:
+    """
+    Decoded textures stored on disk as .npz files, named after a hash of everything decoding depends on
+    (texel and palette bytes, format, size, mirroring), so they are shared between imports and Blender sessions.
+    When the files take more than max_size bytes, least recently used ones are removed.
+    """
+    version = 1
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self.entries = None # name -> [size, last use time]
+        self.total_size = 0
+
+    @classmethod
+    def makeKey(cls, buffers, params):
+        h = hashlib.sha1(repr((cls.version, tuple(params), tuple(len(b) for b in buffers))).encode())
+        for b in buffers:
+            h.update(b)
+        return h.hexdigest()
+
+    def loadEntries(self):
+        if self.entries is not None:
+            return
+        self.entries = {}
+        self.total_size = 0
+        os.makedirs(self.path, exist_ok=True)
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".npz"):
+                    stat = entry.stat()
+                    self.entries[entry.name] = [stat.st_size, stat.st_mtime]
+                    self.total_size += stat.st_size
+
+    def get(self, key):
+        """Returns (pixels, palette) as stored by put(), or None"""
+        self.loadEntries()
+        name = f"{key}.npz"
+        if name not in self.entries:
+            return None
+        path = os.path.join(self.path, name)
+        try:
+            with np.load(path) as npz:
+                pixels = npz["pixels"]
+                palette = npz["palette"] if "palette" in npz.files else None
+            # mark as recently used, the modification time is the last use time
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            self.remove(name)
+            return None
+        self.entries[name][1] = time.time()
+        return pixels, palette
+
+    def put(self, key, pixels, palette=None):
+        self.loadEntries()
+        name = f"{key}.npz"
+        path = os.path.join(self.path, name)
+        arrays = {"pixels": pixels}
+        if palette is not None:
+            arrays["palette"] = palette
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as file:
+                np.savez(file, **arrays)
+            os.replace(temp_path, path)
+            size = os.path.getsize(path)
+        except OSError:
+            if os.path.isfile(temp_path):
+                os.remove(temp_path)
+            return
+        if name in self.entries:
+            self.total_size -= self.entries[name][0]
+        self.entries[name] = [size, time.time()]
+        self.total_size += size
+        self.evict()
+
+    def remove(self, name):
+        size, _ = self.entries.pop(name, (0, 0))
+        self.total_size -= size
+        try:
+            os.remove(os.path.join(self.path, name))
+        except OSError:
+            pass
+
+    def evict(self):
+        if self.total_size <= self.max_size:
+            return
+        for name in sorted(self.entries, key=lambda name: self.entries[name][1]):
+            self.remove(name)
+            if self.total_size <= self.max_size:
+                break